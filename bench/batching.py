@@ -0,0 +1,45 @@
+"""Breakpoint setup over a slow link, one call per breakpoint against one batch
+
+Starts the fake bridge with a simulated round trip latency and sets the
+same breakpoints with single calls and with LLDBProxy.batch().
+
+    python3 bench/batching.py [breakpoints] [latency ms]
+"""
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lldb_rpc import LLDBProxy
+from fake_bridge import serve
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+
+    server, url = serve(0, latency=latency / 1000.0)
+    lldb = LLDBProxy(url, pool_size=1, compress_threshold=1400)
+    breakpoints = [("/tmp/fake/Sources/File{}.swift".format(i % 10), i, None, 0) for i in range(count)]
+
+    start = perf_counter()
+    for bp in breakpoints:
+        lldb.set_breakpoint(*bp)
+    single = perf_counter() - start
+
+    start = perf_counter()
+    lldb.batch([('set_breakpoint', bp) for bp in breakpoints])
+    batched = perf_counter() - start
+
+    print("{} breakpoints, {:.0f}ms latency".format(count, latency))
+    print("{: <8} {: >10}".format("calls", "total ms"))
+    print("{: <8} {: >10.1f}".format("single", single * 1000))
+    print("{: <8} {: >10.1f}".format("batch", batched * 1000))
+
+    lldb.close()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
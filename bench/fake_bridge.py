@@ -0,0 +1,459 @@
+"""Scripted stand-in for the lldb bridge
+
+Speaks the bridge protocol over XML-RPC or JSON lines without LLDB, for
+trying the plugin and the benchmarks against a bridge with a known
+target. Every session has `threads` threads with `frames` frames each and
+`variables` locals per frame, continuing runs for `run_time` seconds and
+then stops at a breakpoint, writing `output` characters of program output
+in between. Every logpoint and counting breakpoint is hit `hits` times per
+run. Processes to attach to are made up as well.
+
+    python3 bench/fake_bridge.py [--latency ms] [--threads N] [--frames M] <port | unix:path>
+
+Point a debug target at it with `"bridge": "http://localhost:<port>"` in
+the project settings. `--latency` delays every request (a batch counts as
+one) to simulate a slow link.
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from time import sleep, perf_counter
+from xmlrpc.server import MultiPathXMLRPCServer, SimpleXMLRPCDispatcher, SimpleXMLRPCRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lldb_rpc import JSONLinesServer
+
+
+class FakeTarget(object):
+    """One debugged program, the calls of a bridge session"""
+
+    def __init__(self, bridge, key, threads=4, frames=32, variables=8, run_time=0.2, output=0, hits=100, int_addresses=False):
+        self._bridge = bridge
+        self._key = key
+        self._threads = threads
+        self._frames = frames
+        self._variables = variables
+        self._run_time = run_time
+        self._output = output
+        self._hits = hits
+        self._int_addresses = int_addresses
+        self._status = "unknown"
+        self._stdout = []
+        self._breakpoints = {}
+        self._next_breakpoint = 1
+        self._stop_id = 0
+        self._run = 0
+        self._lock = threading.Lock()
+
+    def _set_status(self, status):
+        with self._lock:
+            if status == self._status:
+                return
+            self._status = status
+            if status.startswith('stopped') or status == 'plan_complete':
+                self._stop_id += 1
+        if self._bridge._on_status:
+            self._bridge._on_status(self._key, status)
+        self._bridge._event({ "type": "status", "status": status, "session": self._key })
+
+    def _write(self, data):
+        with self._lock:
+            self._stdout.append(data)
+        self._bridge._event({ "type": "stdout", "data": data, "session": self._key })
+
+    def _continue(self, status):
+        # runs in the background, a later continue makes this run obsolete
+        self._set_status(status)
+        self._run += 1
+        run = self._run
+
+        def finish():
+            if self._output:
+                self._write(("x" * 79 + "\n") * (self._output // 80) + "x" * (self._output % 80))
+            if status == "running":
+                self._hit_breakpoints()
+            sleep(self._run_time)
+            if run == self._run and self._status == status:
+                self._set_status("stopped,breakpoint" if status == "running" else "plan_complete")
+        threading.Thread(target=finish, daemon=True).start()
+        return True
+
+    # launch, attach and connect
+
+    def prepare(self, executable, params, environment, path, working_dir):
+        self._set_status("stopped,signal")
+        return True
+
+    def attach(self, executable, pid, name, wait_for):
+        if pid is None and not any(process['name'] == name for process in self._bridge.list_processes()):
+            raise xmlrpc.client.Fault(1, 'no process named "{}"'.format(name))
+        self._set_status("stopped,signal")
+        return True
+
+    def connect_remote(self, executable, url):
+        if not url.startswith('connect://'):
+            raise xmlrpc.client.Fault(1, 'invalid remote url "{}"'.format(url))
+        self._set_status("stopped,signal")
+        return True
+
+    def detach(self):
+        self._run += 1
+        self._set_status("exited,detached")
+        return True
+
+    def list_processes(self):
+        return self._bridge.list_processes()
+
+    # run control
+
+    def get_status(self):
+        return self._status
+
+    def start(self):
+        return self._continue("running")
+
+    def pause(self):
+        self._run += 1
+        self._set_status("stopped,signal")
+        return True
+
+    def step_into(self):
+        return self._continue("stepping")
+
+    def step_over(self):
+        return self._continue("stepping")
+
+    def step_out(self):
+        return self._continue("stepping")
+
+    def stop(self):
+        self._run += 1
+        self._set_status("exited,killed")
+        return True
+
+    def shutdown_server(self):
+        threading.Thread(target=self._bridge._shutdown, daemon=True).start()
+        return True
+
+    def get_stdout(self, max_size=None):
+        with self._lock:
+            data = "".join(self._stdout)
+            if max_size is not None and len(data) > max_size:
+                self._stdout = [data[max_size:]]
+                return data[:max_size]
+            self._stdout = []
+            return data
+
+    def execute_lldb_command(self, command):
+        return { "succeeded": True, "output": "(fake) {}\n".format(command) }
+
+    # stop state
+
+    def _frame(self, thread, index):
+        address = 0x100000000 + thread * 0x10000 + index * 16
+        return {
+            "module": "fake",
+            "address": address if self._int_addresses else str(address),
+            "file": "/tmp/fake/Sources/File{}.swift".format(index % 10),
+            "line": index + 1,
+            "column": 5,
+            "function": "fake.function{}() -> ()".format(index),
+            "inlined": False
+        }
+
+    def get_backtrace(self, thread_ids=None, start=0, count=0):
+        threads = {}
+        for thread in range(1, self._threads + 1):
+            if thread_ids is not None and thread not in thread_ids and str(thread) not in thread_ids:
+                continue
+            end = self._frames if count <= 0 else min(self._frames, start + count)
+            threads[str(thread)] = {
+                "index": thread,
+                "id": thread,
+                "name": "thread{}".format(thread),
+                "queue": "fake.queue",
+                "selected": thread == 1,
+                "stop_reason": "breakpoint 1.1" if thread == 1 else "none",
+                "frame_count": self._frames,
+                "bt": [self._frame(thread, index) for index in range(start, end)]
+            }
+        return threads
+
+    def get_backtrace_for_selected_thread(self):
+        return self.get_backtrace([1])["1"]
+
+    def get_local_variables(self, thread_id, frame):
+        return dict(("var{}".format(i), str(i * self._stop_id)) for i in range(self._variables))
+
+    def get_variables(self, thread_id, frame):
+        return [
+            { "handle": "{}:{}:{}".format(thread_id, frame, i), "name": "var{}".format(i), "type": "Int", "value": str(i * self._stop_id), "children": 0 }
+            for i in range(self._variables)
+        ]
+
+    def get_variable_children(self, handle, start, count):
+        return []
+
+    def get_stop_snapshot(self, depth):
+        threads = self.get_backtrace(None, 0, depth)
+        return {
+            "version": 1,
+            "stop_id": self._stop_id,
+            "status": self._status,
+            "threads": threads,
+            "location": { "file": "/tmp/fake/Sources/File0.swift", "line": 1 },
+            "locals": { "thread": 1, "frame": 0, "variables": self.get_variables(1, 0) }
+        }
+
+    def evaluate_expressions(self, expressions, thread_id, frame, timeout):
+        # locals evaluate to their value, everything else is unknown
+        results = []
+        for expression in expressions:
+            if expression.startswith('var') and expression[3:].isdigit() and int(expression[3:]) < self._variables:
+                results.append({ "value": str(int(expression[3:]) * self._stop_id), "type": "Int", "error": None })
+            else:
+                results.append({ "value": None, "type": None, "error": "use of unresolved identifier '{}'".format(expression) })
+        return results
+
+    def read_memory(self, address, size):
+        # every byte is the low byte of its address, the first 64 kB are not mapped
+        address = int(address)
+        if address < 0x10000:
+            raise xmlrpc.client.Fault(1, "memory read failed for 0x{:x}".format(address))
+        return xmlrpc.client.Binary(bytes((address + i) & 0xff for i in range(size)))
+
+    # sampling profiler
+
+    def start_sampling(self, rate, depth):
+        self._sampling = (perf_counter(), rate, depth)
+        return True
+
+    def stop_sampling(self):
+        # made up samples for the time it ran, deeper stacks are rarer
+        start, rate, depth = self._sampling
+        duration = perf_counter() - start
+        samples = int(duration * rate)
+        stacks = {}
+        for sample in range(samples):
+            for thread in range(1, self._threads + 1):
+                height = min(depth, 1 + (sample * thread) % 7, self._frames)
+                stack = ";".join("fake.function{}() -> ()".format(index) for index in reversed(range(height)))
+                stacks[stack] = stacks.get(stack, 0) + 1
+        return { "samples": samples, "duration": duration, "rate": rate, "stacks": stacks }
+
+    # breakpoints
+
+    def set_breakpoint(self, file, line, condition, ignore_count):
+        bp_id = self._next_breakpoint
+        self._next_breakpoint += 1
+        self._breakpoints[bp_id] = { "file": file, "line": line, "enabled": True, "log": None, "counter": None }
+        return bp_id
+
+    def set_logpoint(self, file, line, message, condition, ignore_count):
+        bp_id = self.set_breakpoint(file, line, condition, ignore_count)
+        self._breakpoints[bp_id]['log'] = message
+        return bp_id
+
+    def set_counter(self, file, line, end_line, condition, ignore_count):
+        bp_id = self.set_breakpoint(file, line, condition, ignore_count)
+        self._breakpoints[bp_id]['counter'] = { "hits": 0, "paired": 0, "paired_time": 0.0, "end_line": end_line }
+        return bp_id
+
+    def get_counters(self, bp_ids):
+        results = []
+        for bp_id in bp_ids:
+            counter = self._breakpoints.get(bp_id, {}).get('counter', None) or { "hits": 0, "paired": 0, "paired_time": 0.0 }
+            results.append({ "hits": counter['hits'], "paired": counter['paired'], "paired_time": counter['paired_time'] })
+        return results
+
+    def _hit_breakpoints(self):
+        # every expression evaluates to the number of the hit, every timed range takes 0.5ms
+        lines = []
+        for bp in list(self._breakpoints.values()):
+            if not bp['enabled']:
+                continue
+            if bp['counter']:
+                bp['counter']['hits'] += self._hits
+                if bp['counter']['end_line'] is not None:
+                    bp['counter']['paired'] += self._hits
+                    bp['counter']['paired_time'] += self._hits * 0.0005
+            elif bp['log']:
+                for hit in range(self._hits):
+                    lines.append(re.sub(r'\{[^}]*\}', str(hit), bp['log']) + "\n")
+        if lines:
+            self._write("".join(lines))
+
+    def delete_breakpoint(self, bp_id):
+        self._breakpoints.pop(bp_id, None)
+        return True
+
+    def delete_all_breakpoints(self):
+        self._breakpoints = {}
+        return True
+
+    def enable_breakpoint(self, bp_id):
+        self._breakpoints[bp_id]['enabled'] = True
+        return True
+
+    def disable_breakpoint(self, bp_id):
+        self._breakpoints[bp_id]['enabled'] = False
+        return True
+
+
+class FakeBridge(FakeTarget):
+    """The bridge's own target plus the bridge wide calls"""
+
+    def __init__(self, server, **target_args):
+        FakeTarget.__init__(self, self, None, **target_args)
+        self._server = server
+        self._target_args = target_args
+        self._sessions = {}
+        self._next_session = 1
+        self._events = []
+        self._events_changed = threading.Condition()
+        self._on_status = None # called with (session, status) on every change, for measurements
+
+    def _event(self, event):
+        with self._events_changed:
+            self._events.append(event)
+            self._events_changed.notify_all()
+
+    def wait_for_event(self, timeout):
+        with self._events_changed:
+            deadline = perf_counter() + timeout
+            while not self._events and perf_counter() < deadline:
+                self._events_changed.wait(deadline - perf_counter())
+            events, self._events = self._events, []
+        return events
+
+    def add_session(self):
+        key = str(self._next_session)
+        self._next_session += 1
+        self._sessions[key] = FakeTarget(self, key, **self._target_args)
+        self._server.add_session(key, self._sessions[key])
+        return key
+
+    def remove_session(self, key):
+        self._sessions.pop(key, None)
+        self._server.remove_session(key)
+        return True
+
+    def list_processes(self):
+        return [
+            { "pid": 1000 + i, "name": name, "path": "/usr/local/bin/" + name }
+            for i, name in enumerate(["fake-server", "fake-worker", "fake-client"])
+        ]
+
+    def _shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class XMLRPCHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ()
+
+    def do_POST(self):
+        sleep(self.server.latency)
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class XMLRPCBridgeServer(ThreadingMixIn, MultiPathXMLRPCServer):
+    """The bridge on /RPC2 and its sessions on /session/<id>"""
+
+    daemon_threads = True
+
+    def __init__(self, port):
+        MultiPathXMLRPCServer.__init__(self, ('localhost', port), requestHandler=XMLRPCHandler, logRequests=False, allow_none=True)
+
+    def _dispatcher(self, instance):
+        dispatcher = SimpleXMLRPCDispatcher(allow_none=True)
+        dispatcher.register_instance(instance)
+        dispatcher.register_multicall_functions()
+        return dispatcher
+
+    def set_bridge(self, bridge):
+        for path in ('/', '/RPC2'):
+            self.add_dispatcher(path, self._dispatcher(bridge))
+
+    def add_session(self, key, target):
+        self.add_dispatcher('/session/{}'.format(key), self._dispatcher(target))
+
+    def remove_session(self, key):
+        self.dispatchers.pop('/session/{}'.format(key), None)
+
+
+class JSONLinesBridgeServer(JSONLinesServer):
+
+    latency = 0.0
+
+    def dispatch_request(self, request):
+        sleep(self.latency)
+        return JSONLinesServer.dispatch_request(self, request)
+
+    def set_bridge(self, bridge):
+        self.register_instance(bridge)
+        self.register_multicall_functions()
+
+    def add_session(self, key, target):
+        self.register_session(key, target)
+
+    def remove_session(self, key):
+        self.unregister_session(key)
+
+    def server_close(self):
+        JSONLinesServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def serve(address, latency=0.0, **target_args):
+    """Starts a fake bridge on a port number or `unix:<path>` and returns (server, url)"""
+    if str(address).startswith('unix:'):
+        path = address[len('unix:'):]
+        server = JSONLinesBridgeServer(path)
+        url = 'unix://' + path
+        target_args['int_addresses'] = True
+    else:
+        server = XMLRPCBridgeServer(int(address))
+        url = 'http://localhost:{}'.format(server.server_address[1])
+    server.latency = latency
+    server.bridge = FakeBridge(server, **target_args)
+    server.set_bridge(server.bridge)
+    server.thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server.thread.start()
+    return server, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted stand-in for the lldb bridge")
+    parser.add_argument('address', help="port number or unix:<path>")
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds added to every request")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=32)
+    parser.add_argument('--variables', type=int, default=8)
+    parser.add_argument('--run-time', type=float, default=0.2, help="seconds a continue runs before the next stop")
+    parser.add_argument('--output', type=int, default=0, help="characters of program output per run")
+    parser.add_argument('--hits', type=int, default=100, help="hits of every logpoint and counter per run")
+    args = parser.parse_args()
+
+    server, url = serve(
+        args.address, latency=args.latency / 1000.0,
+        threads=args.threads, frames=args.frames, variables=args.variables,
+        run_time=args.run_time, output=args.output, hits=args.hits
+    )
+    print("fake bridge on", url)
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Stop-to-render latency, bridge calls and memory of the plugin over many steps
+
+Loads the plugin with the Sublime stand-ins of sublime_stub.py against the
+fake bridge, starts a debug session with saved breakpoints and steps it
+`--steps` times (every tenth step is a continue). Every step is timed from
+the moment the bridge reports the stop until the stack view is rewritten.
+Afterwards the debugger is left alone for `--idle` seconds with the target
+stopped and as long again with it running, counting the bridge calls.
+
+    python3 bench/soak.py [--steps 10000] [--threads 8] [--frames 64] [--output 4096] [--json results.json]
+    python3 bench/soak.py --polling --steps 50
+
+Reports startup time (start command to the first rendered stop, including
+breakpoint sync), stop-to-render p50/p99/max, bridge calls per step, idle
+bridge calls per second, the plugin's UI timings and memory (RSS and live
+Python objects) sampled during the run. `--polling` turns event
+notifications off to compare against the one second polling loop, which
+takes up to a second per step.
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+from time import perf_counter, sleep
+
+bench = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(bench)
+sys.path.insert(0, bench)
+sys.path.insert(0, root)
+
+import sublime_stub
+from fake_bridge import serve
+from perf import Histogram, format_summary
+
+
+def rss():
+    # current resident set size in bytes, peak if /proc is not there
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Recorder(object):
+    """Stop times reported by the fake bridge and render times of the stack view"""
+
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.stops = []
+        self.renders = []
+
+    def on_status(self, session, status):
+        if status.startswith('stopped') or status == 'plan_complete':
+            with self.changed:
+                self.stops.append(perf_counter())
+                self.changed.notify_all()
+
+    def on_command(self, view, name):
+        if name == 'update_lldb_stack':
+            with self.changed:
+                self.renders.append(perf_counter())
+                self.changed.notify_all()
+
+    def wait_render(self, stop_index, timeout):
+        """Latency from stop number stop_index to the first render after it, None on timeout"""
+        deadline = perf_counter() + timeout
+        with self.changed:
+            while True:
+                if len(self.stops) > stop_index:
+                    stop = self.stops[stop_index]
+                    later = [render for render in self.renders[-8:] if render >= stop]
+                    if later:
+                        return min(later) - stop
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+
+
+def idle_calls(debug, window, seconds):
+    # bridge calls per second by name while nobody touches the debugger
+    def calls():
+        return dict((name, stat['calls']) for name, stat in debug.rpc_timings(window).summary().items())
+    before = calls()
+    sleep(seconds)
+    after = calls()
+    return dict((name, (count - before.get(name, 0)) / seconds) for name, count in after.items() if count > before.get(name, 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of the plugin against the fake bridge")
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--frames', type=int, default=64)
+    parser.add_argument('--variables', type=int, default=16)
+    parser.add_argument('--output', type=int, default=0, help="characters of program output per step")
+    parser.add_argument('--breakpoints', type=int, default=100)
+    parser.add_argument('--transport', choices=['xmlrpc', 'jsonlines'], default='xmlrpc')
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds added to every bridge request")
+    parser.add_argument('--samples', type=int, default=10, help="memory samples over the run")
+    parser.add_argument('--polling', action='store_true', help="poll the bridge instead of waiting for events")
+    parser.add_argument('--idle', type=float, default=10.0, help="seconds of each idle phase, 0 to skip them")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    sublime_stub.install()
+    package = sublime_stub.load_plugin(root, settings={ "auto_show_lldb_console": True, "event_notifications": not args.polling })
+    debug = sys.modules[package.__name__ + '.debug']
+    perf = sys.modules[package.__name__ + '.perf']
+
+    tmp = tempfile.mkdtemp()
+    address = 'unix:' + os.path.join(tmp, 'bridge.sock') if args.transport == 'jsonlines' else 0
+    server, url = serve(
+        address, latency=args.latency / 1000.0, threads=args.threads, frames=args.frames,
+        variables=args.variables, run_time=0.0, output=args.output
+    )
+    recorder = Recorder()
+    server.bridge._on_status = recorder.on_status
+
+    breakpoints = [
+        { "file": "/tmp/fake/Sources/File{}.swift".format(i % 10), "line": i, "enabled": i % 7 != 0, "condition": None, "ignore_count": 0 }
+        for i in range(args.breakpoints)
+    ]
+    project = {
+        "settings": {
+            "SublimeAnarchyDebug": {
+                "debug": { "name": "fake", "executable": "/tmp/fake/bin/fake", "bridge": url },
+                "breakpoints": breakpoints
+            }
+        }
+    }
+    window = sublime_stub.Window(project, os.path.join(tmp, 'fake.sublime-project'))
+    window.on_new_view = lambda view: setattr(view, 'on_command', recorder.on_command)
+
+    start = perf_counter()
+    sublime_stub.ui_loop.call(lambda: window.run_command('atdebug', { "start": True }))
+    # the first continue stops at the (fake) breakpoint
+    startup = recorder.wait_render(1, 30)
+    if startup is None:
+        print("debugger did not start")
+        return 1
+    startup = recorder.renders[-1] - start
+
+    gc.collect()
+    memory = [(0, rss(), len(gc.get_objects()))]
+    latencies = Histogram()
+    timeouts = 0
+    sample_every = max(1, args.steps // max(1, args.samples))
+    run_start = perf_counter()
+    for step in range(1, args.steps + 1):
+        action = 'continue' if step % 10 == 0 else 'step_over'
+        stop_index = len(recorder.stops)
+        sublime_stub.ui_loop.call(lambda: window.run_command('atdebug', { "action": action }))
+        latency = recorder.wait_render(stop_index, 10)
+        if latency is None:
+            timeouts += 1
+        else:
+            latencies.add(latency)
+        if step % sample_every == 0:
+            sublime_stub.wait_idle()
+            gc.collect()
+            memory.append((step, rss(), len(gc.get_objects())))
+    run_time = perf_counter() - run_start
+
+    rpc = debug.rpc_timings(window).summary()
+    idle = {}
+    if args.idle > 0:
+        sublime_stub.wait_idle()
+        idle['stopped'] = idle_calls(debug, window, args.idle)
+        # the target keeps running until it is paused
+        for target in [server.bridge] + list(server.bridge._sessions.values()):
+            target._run_time = args.idle * 10
+        sublime_stub.ui_loop.call(lambda: window.run_command('atdebug', { "action": "continue" }))
+        sleep(0.5)
+        idle['running'] = idle_calls(debug, window, args.idle)
+        sublime_stub.ui_loop.call(lambda: window.run_command('atdebug', { "action": "pause" }))
+
+    ui = perf.ui_timings.summary()
+    results = {
+        "config": vars(args),
+        "startup": startup,
+        "steps_per_second": args.steps / run_time,
+        "stop_to_render": { "count": latencies.count, "timeouts": timeouts, "p50": latencies.percentile(50), "p99": latencies.percentile(99), "max": latencies.max },
+        "rpc_calls_per_step": dict((name, stat['calls'] / float(args.steps)) for name, stat in rpc.items()),
+        "rpc": rpc,
+        "idle_rpc_per_second": idle,
+        "ui": ui,
+        "memory": [{ "step": step, "rss": size, "objects": objects } for step, size, objects in memory]
+    }
+
+    print("{} steps, {} threads x {} frames, {} locals, {} breakpoints, {} transport, {}".format(
+        args.steps, args.threads, args.frames, args.variables, args.breakpoints, args.transport,
+        "polling" if args.polling else "events"))
+    print("startup             {:>9.1f} ms".format(startup * 1000))
+    print("steps per second    {:>9.1f}".format(results['steps_per_second']))
+    print("stop to render      p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms, {} timeouts".format(
+        latencies.percentile(50) * 1000, latencies.percentile(99) * 1000, latencies.max * 1000, timeouts))
+    print("bridge calls/step   " + ", ".join("{} {:.2f}".format(name, calls) for name, calls in sorted(results['rpc_calls_per_step'].items())))
+    for state in sorted(idle):
+        print("idle calls/s {: <8}{:.2f} ({})".format(state, sum(idle[state].values()),
+            ", ".join("{} {:.2f}".format(name, calls) for name, calls in sorted(idle[state].items())) or "none"))
+    print("memory              rss {:.1f} MB -> {:.1f} MB, objects {} -> {}".format(
+        memory[0][1] / 1048576.0, memory[-1][1] / 1048576.0, memory[0][2], memory[-1][2]))
+    print("")
+    print(format_summary("Bridge calls", rpc))
+    print("")
+    print(format_summary("UI", ui))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    sublime_stub.ui_loop.call(lambda: window.run_command('atdebug', { "stop": True }))
+    sublime_stub.wait_idle()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
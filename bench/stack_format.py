@@ -0,0 +1,56 @@
+"""Formatting time of the LLDB Stack view for a large process
+
+Formats a synthetic stop with 500 threads of 64 frames each, half of them
+with source locations, like update_stack does on every stop.
+
+    python3 bench/stack_format.py [threads] [frames]
+"""
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lldb_format import StackFormatter
+
+
+def backtrace(threads, frames):
+    bt = {}
+    for t in range(threads):
+        stack = []
+        for i in range(frames):
+            if i % 2:
+                stack.append({
+                    "module": "libexample.so",
+                    "address": str(0x7fff5fbff000 + i * 16),
+                    "file": "/home/user/project/Sources/example/File{}.swift".format(i % 40),
+                    "line": i + 1,
+                    "column": 9,
+                    "function": "example.Type.function{}(Swift.Int) -> Swift.Int".format(i),
+                    "inlined": False
+                })
+            else:
+                stack.append({
+                    "module": "libc.so.6",
+                    "address": str(0x7f0000001000 + i * 16),
+                    "symbol": "__pthread_cond_wait",
+                    "offset": str(i * 4)
+                })
+        bt[str(t)] = { "index": t + 1, "id": 1000 + t, "name": "worker", "queue": None, "selected": t == 0, "stop_reason": "none", "bt": stack }
+    return bt
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    bt = backtrace(threads, frames)
+    formatter = StackFormatter("/home/user/project")
+
+    for run in ("cold", "warm"):
+        start = perf_counter()
+        text = "".join(formatter.format_thread(info)[0] for info in bt.values())
+        duration = perf_counter() - start
+        print("{} threads x {} frames, {}: {:.1f} ms, {} characters".format(threads, frames, run, duration * 1000, len(text)))
+
+
+if __name__ == '__main__':
+    main()
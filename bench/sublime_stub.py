@@ -0,0 +1,483 @@
+"""Minimal stand-ins for the `sublime` and `sublime_plugin` modules
+
+Enough of the Sublime Text 3 API to load the plugin and drive it without
+the editor: views are plain strings, set_timeout runs on a UI thread and
+set_timeout_async on a worker thread like in the editor, and commands are
+looked up by the same name rules. Quick panels pick their first item and
+input panels take their initial text.
+
+    import sublime_stub
+    sublime_stub.install()
+    package = sublime_stub.load_plugin(repo_root)
+    window = sublime_stub.Window(project_data, project_file)
+"""
+import heapq
+import importlib
+import itertools
+import os
+import sys
+import threading
+import types
+from time import perf_counter, sleep
+
+HIDDEN = 128
+DRAW_NO_FILL = 32
+ENCODED_POSITION = 1
+LAYOUT_INLINE = 0
+
+api_lock = threading.RLock() # commands edit one view at a time, like the editor's main thread
+settings_values = {}
+commands = {} # key = command name, value command class
+status_messages = []
+ids = itertools.count(1)
+
+
+class Region(object):
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return "Region({}, {})".format(self.a, self.b)
+
+
+class Selection(list):
+
+    def clear(self):
+        del self[:]
+
+    def add(self, x):
+        self.append(x if isinstance(x, Region) else Region(x))
+
+
+class Phantom(object):
+
+    def __init__(self, region, content, layout, on_navigate=None):
+        self.region = region
+        self.content = content
+        self.layout = layout
+
+
+class PhantomSet(object):
+
+    def __init__(self, view, key=""):
+        self.view = view
+        self.key = key
+
+    def update(self, phantoms):
+        self.view.phantoms[self.key] = list(phantoms)
+
+
+class Settings(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def load_settings(name):
+    return Settings(settings_values)
+
+
+class Loop(object):
+    """Runs callbacks one after the other on a thread of its own, by due time"""
+
+    def __init__(self, name):
+        self.queue = []
+        self.counter = itertools.count()
+        self.changed = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def post(self, func, delay=0):
+        with self.changed:
+            heapq.heappush(self.queue, (perf_counter() + delay / 1000.0, next(self.counter), func))
+            self.changed.notify()
+
+    def call(self, func):
+        """Runs func on the loop and returns its result"""
+        if threading.current_thread() is self.thread:
+            return func()
+        done = threading.Event()
+        result = []
+        def run():
+            try:
+                result.append(func())
+            finally:
+                done.set()
+        self.post(run)
+        done.wait()
+        return result[0] if result else None
+
+    def _run(self):
+        while True:
+            with self.changed:
+                while not self.queue or self.queue[0][0] > perf_counter():
+                    self.changed.wait(self.queue[0][0] - perf_counter() if self.queue else None)
+                due, count, func = heapq.heappop(self.queue)
+            try:
+                func()
+            except Exception as e:
+                print("callback failed:", type(e).__name__, e)
+
+ui_loop = None
+async_loop = None
+
+def set_timeout(func, delay=0):
+    ui_loop.post(func, delay)
+
+def set_timeout_async(func, delay=0):
+    async_loop.post(func, delay)
+
+def packages_path():
+    return os.path.join(os.path.expanduser('~'), '.config', 'sublime-text-3', 'Packages')
+
+def status_message(message):
+    status_messages.append(message)
+
+def version():
+    return '3211'
+
+
+def command_name(cls):
+    # the editor's rule, atdebugConsole -> atdebug_console
+    name = cls.__name__[0].lower()
+    last_upper = False
+    for c in cls.__name__[1:]:
+        if c.isupper() and not last_upper:
+            name += '_' + c.lower()
+        else:
+            name += c
+        last_upper = c.isupper()
+    if name.endswith('_command'):
+        name = name[:-8]
+    return name
+
+
+class View(object):
+
+    def __init__(self, window, file_name=None):
+        self.view_id = next(ids)
+        self.parent = window
+        self.path = file_name
+        self.view_name = ""
+        self.text = ""
+        self.syntax = None
+        self.selection = Selection()
+        self.regions = {}
+        self.status = {}
+        self.phantoms = {} # key = PhantomSet key, value list of Phantom
+        self.scratch = False
+        self.on_command = None # called with (view, name) after every command, for measurements
+        self.viewport = None # (first row, rows) shown, everything if None
+
+    def id(self):
+        return self.view_id
+
+    def window(self):
+        return self.parent
+
+    def name(self):
+        return self.view_name
+
+    def set_name(self, name):
+        self.view_name = name
+
+    def file_name(self):
+        return self.path
+
+    def set_scratch(self, scratch):
+        self.scratch = scratch
+
+    def set_syntax_file(self, syntax):
+        self.syntax = syntax
+
+    def scope_name(self, point):
+        if self.syntax and 'lldb_console' in self.syntax:
+            return 'lldb.console '
+        if self.syntax and 'lldb_stack' in self.syntax:
+            return 'lldb.stack '
+        if self.syntax and 'lldb_memory' in self.syntax:
+            return 'lldb.memory '
+        if self.path and self.path.endswith('.swift'):
+            return 'source.swift '
+        return 'text.plain '
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def insert(self, edit, point, text):
+        self.text = self.text[:point] + text + self.text[point:]
+        return len(text)
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.begin()] + text + self.text[region.end():]
+
+    def erase(self, edit, region):
+        self.replace(edit, region, "")
+
+    def line(self, x):
+        if isinstance(x, Region):
+            x = x.begin()
+        start = self.text.rfind('\n', 0, x) + 1
+        end = self.text.find('\n', x)
+        return Region(start, len(self.text) if end < 0 else end)
+
+    def rowcol(self, point):
+        row = self.text.count('\n', 0, point)
+        return row, point - (self.text.rfind('\n', 0, point) + 1)
+
+    def text_point(self, row, col):
+        point = 0
+        for i in range(row):
+            next_line = self.text.find('\n', point)
+            if next_line < 0:
+                return len(self.text)
+            point = next_line + 1
+        return min(point + col, len(self.text))
+
+    def sel(self):
+        return self.selection
+
+    def show(self, x, show_surrounds=True):
+        pass
+
+    def show_at_center(self, x):
+        pass
+
+    def visible_region(self):
+        if self.viewport is None:
+            return Region(0, len(self.text))
+        first, rows = self.viewport
+        return Region(self.text_point(first, 0), self.line(self.text_point(first + rows - 1, 0)).end())
+
+    def add_regions(self, key, regions, scope="", icon="", flags=0):
+        self.regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return self.regions.get(key, [])
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def set_status(self, key, value):
+        self.status[key] = value
+
+    def erase_status(self, key):
+        self.status.pop(key, None)
+
+    def run_command(self, name, args=None):
+        with api_lock:
+            if name == 'append':
+                self.text += args['characters']
+            else:
+                cls = commands.get(name, None)
+                if cls is None:
+                    return
+                command = cls(self)
+                if command.is_enabled(**(args or {})) is False:
+                    return
+                command.run(None, **(args or {}))
+        if self.on_command:
+            self.on_command(self, name)
+
+
+class Window(object):
+
+    def __init__(self, project_data=None, project_file=None):
+        self.window_id = next(ids)
+        self.view_list = []
+        self.panels = {}
+        self.data = project_data or {}
+        self.project_file = project_file
+        self.layout = { "cols": [0, 1], "rows": [0, 1], "cells": [[0, 0, 1, 1]] }
+        self.group = 0
+        self.active = None
+        self.on_new_view = None # called with every new view
+
+    def id(self):
+        return self.window_id
+
+    def views(self):
+        return list(self.view_list)
+
+    def new_file(self):
+        view = View(self)
+        self.view_list.append(view)
+        self.active = view
+        if self.on_new_view:
+            self.on_new_view(view)
+        return view
+
+    def open_file(self, file_name, flags=0):
+        if flags & ENCODED_POSITION:
+            file_name = file_name.split(':')[0]
+        for view in self.view_list:
+            if view.file_name() == file_name:
+                return view
+        view = self.new_file()
+        view.path = file_name
+        if os.path.exists(file_name):
+            with open(file_name) as f:
+                view.text = f.read()
+        return view
+
+    def active_view(self):
+        return self.active
+
+    def focus_view(self, view):
+        self.active = view
+
+    def focus_group(self, group):
+        self.group = group
+
+    def active_group(self):
+        return self.group
+
+    def get_layout(self):
+        return self.layout
+
+    def set_layout(self, layout):
+        self.layout = layout
+
+    def project_data(self):
+        return self.data
+
+    def set_project_data(self, data):
+        self.data = data
+
+    def project_file_name(self):
+        return self.project_file
+
+    def create_output_panel(self, name):
+        panel = View(self)
+        self.panels[name] = panel
+        return panel
+
+    def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None):
+        set_timeout(lambda: on_select(0 if items else -1))
+
+    def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+        set_timeout(lambda: on_done(initial_text))
+
+    def run_command(self, name, args=None):
+        if name == 'close_file':
+            if self.active in self.view_list:
+                self.view_list.remove(self.active)
+            self.active = self.view_list[-1] if self.view_list else None
+            return
+        cls = commands.get(name, None)
+        if cls is None:
+            return
+        command = cls(self)
+        if command.is_enabled(**(args or {})) is False:
+            return
+        command.run(**(args or {}))
+
+
+class Command(object):
+
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+    def is_visible(self, *args, **kwargs):
+        return True
+
+
+class WindowCommand(Command):
+
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand(Command):
+
+    def __init__(self, view):
+        self.view = view
+
+
+class ApplicationCommand(Command):
+    pass
+
+
+class EventListener(object):
+    pass
+
+
+def install():
+    """Puts the stand-ins into sys.modules and starts the UI and async threads"""
+    global ui_loop, async_loop
+    sublime = types.ModuleType('sublime')
+    sublime_plugin = types.ModuleType('sublime_plugin')
+    module = sys.modules[__name__]
+    for name in ('Region', 'Phantom', 'PhantomSet', 'HIDDEN', 'DRAW_NO_FILL', 'ENCODED_POSITION', 'LAYOUT_INLINE', 'load_settings', 'set_timeout',
+                 'set_timeout_async', 'packages_path', 'status_message', 'version'):
+        setattr(sublime, name, getattr(module, name))
+    for name in ('WindowCommand', 'TextCommand', 'ApplicationCommand', 'EventListener'):
+        setattr(sublime_plugin, name, getattr(module, name))
+    sys.modules['sublime'] = sublime
+    sys.modules['sublime_plugin'] = sublime_plugin
+    if ui_loop is None:
+        ui_loop = Loop('ui')
+        async_loop = Loop('async')
+
+def load_plugin(root, package='SublimeAnarchyDebug', settings=None):
+    """Imports every plugin module of the package at root like the editor does"""
+    settings_values.update(settings or {})
+    module = types.ModuleType(package)
+    module.__path__ = [root]
+    sys.modules[package] = module
+    plugins = []
+    for file_name in sorted(os.listdir(root)):
+        if file_name.endswith('.py'):
+            plugins.append(importlib.import_module(package + '.' + file_name[:-3]))
+    for plugin in plugins:
+        for value in vars(plugin).values():
+            if isinstance(value, type) and issubclass(value, (WindowCommand, TextCommand)) and value not in (WindowCommand, TextCommand):
+                commands[command_name(value)] = value
+    for plugin in plugins:
+        if hasattr(plugin, 'plugin_loaded'):
+            ui_loop.call(plugin.plugin_loaded)
+    return module
+
+def unload_plugin(package='SublimeAnarchyDebug'):
+    for name, module in list(sys.modules.items()):
+        if name.startswith(package + '.') and hasattr(module, 'plugin_unloaded'):
+            ui_loop.call(module.plugin_unloaded)
+
+def wait_idle(timeout=5.0):
+    """Waits until both loops ran everything that is due"""
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        if ui_loop.call(lambda: True) and async_loop.call(lambda: True):
+            return True
+        sleep(0.001)
+    return False
@@ -0,0 +1,81 @@
+"""Call latency and payload size of the bridge transports
+
+Serves a synthetic single thread backtrace with 200 frames over XML-RPC and
+over JSON lines on a unix socket and calls it through LLDBProxy.
+
+    python3 bench/transport.py [calls]
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lldb_rpc import LLDBProxy, JSONLinesServer
+
+
+class XMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+def backtrace(frames, address_type):
+    bt = []
+    for i in range(frames):
+        bt.append({
+            "module": "libexample.so",
+            "address": address_type(0x7fff5fbff000 + i * 16),
+            "file": "/home/user/project/Sources/example/File{}.swift".format(i % 10),
+            "line": i + 1,
+            "column": 9,
+            "function": "example.Type.function{}(Swift.Int) -> Swift.Int".format(i),
+            "inlined": False
+        })
+    return { "1": { "index": 1, "id": 1, "name": "main", "queue": "com.apple.main-thread", "selected": True, "stop_reason": "breakpoint 1.1", "bt": bt } }
+
+
+def measure(proxy, calls):
+    proxy.get_backtrace()
+    start = perf_counter()
+    for i in range(calls):
+        proxy.get_backtrace()
+    return (perf_counter() - start) / calls
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    # XML-RPC ints are 32 bit, so the bridge sends addresses as strings
+    xml_bt = backtrace(200, str)
+    xml_server = XMLRPCServer(('localhost', 0), logRequests=False, allow_none=True)
+    xml_server.register_function(lambda: xml_bt, 'get_backtrace')
+    threading.Thread(target=xml_server.serve_forever, daemon=True).start()
+    xml_proxy = LLDBProxy('http://localhost:{}'.format(xml_server.server_address[1]), pool_size=1)
+    xml_size = len(xmlrpc.client.dumps((xml_bt,), methodresponse=True, allow_none=True).encode('utf-8'))
+
+    json_bt = backtrace(200, int)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sock')
+    json_server = JSONLinesServer(path)
+    json_server.register_function(lambda: json_bt, 'get_backtrace')
+    threading.Thread(target=json_server.serve_forever, daemon=True).start()
+    json_proxy = LLDBProxy('unix://' + path, pool_size=1)
+    json_size = len(json.dumps({ "id": 1, "result": json_bt }).encode('utf-8')) + 1
+
+    print("200 frame backtrace, {} calls".format(calls))
+    print("{: <10} {: >12} {: >14}".format("transport", "latency ms", "payload bytes"))
+    for name, proxy, size in (("xmlrpc", xml_proxy, xml_size), ("jsonlines", json_proxy, json_size)):
+        print("{: <10} {: >12.3f} {: >14}".format(name, measure(proxy, calls) * 1000, size))
+
+    xml_proxy.close()
+    json_proxy.close()
+    xml_server.shutdown()
+    json_server.shutdown()
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
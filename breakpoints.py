@@ -0,0 +1,138 @@
+import sublime
+
+import os
+
+stores = {} # key = window.id, value BreakpointStore
+
+
+class BreakpointStore(object):
+    """In memory copy of the breakpoints and watch expressions saved in a window's project data
+
+    Breakpoints are indexed by file and line, so marker updates and menu
+    checks only look at the breakpoints of one file instead of deserializing
+    the whole project. The copy is reloaded when the project file changed on
+    disk.
+
+    Changes are written back to the project data after a quiet period of
+    `breakpoint_save_delay` milliseconds, so a burst of toggles rewrites the
+    project file once. Watch expressions are written with them, so neither
+    write overwrites a pending change of the other.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.breakpoints = []
+        self.by_file = {} # key = file name, value dict line -> breakpoint
+        self.watches = []
+        self.mtime = None
+        self.loaded = False
+        self.dirty = False
+        self.generation = 0
+        self.mutations = 0
+        self.writes = 0
+
+    def _project_mtime(self):
+        try:
+            return os.stat(self.window.project_file_name()).st_mtime
+        except (OSError, TypeError):
+            return None
+
+    def _refresh(self):
+        if self.loaded and self.dirty:
+            # unsaved changes win over the project file
+            return
+        mtime = self._project_mtime()
+        if self.loaded and mtime == self.mtime:
+            return
+        project_data = self.window.project_data() or {}
+        self.breakpoints = project_data.get('settings', {}).get('SublimeAnarchyDebug', {}).get('breakpoints', [])
+        self.watches = project_data.get('settings', {}).get('SublimeAnarchyDebug', {}).get('watches', [])
+        self.by_file = {}
+        for bp in self.breakpoints:
+            self.by_file.setdefault(bp['file'], {})[bp['line']] = bp
+        self.mtime = mtime
+        self.loaded = True
+
+    def all(self):
+        self._refresh()
+        return self.breakpoints
+
+    def for_file(self, file):
+        self._refresh()
+        return self.by_file.get(file, {})
+
+    def get(self, file, line):
+        return self.for_file(file).get(line, None)
+
+    def add(self, bp):
+        self._refresh()
+        self.breakpoints.append(bp)
+        self.by_file.setdefault(bp['file'], {})[bp['line']] = bp
+        self.save()
+
+    def remove(self, file, line):
+        bp = self.for_file(file).pop(line, None)
+        if bp:
+            self.breakpoints.remove(bp)
+            self.save()
+        return bp
+
+    def update(self, bp, **changes):
+        bp.update(changes)
+        self.save()
+
+    def watch_expressions(self):
+        self._refresh()
+        return self.watches
+
+    def set_watch_expressions(self, expressions):
+        self._refresh()
+        self.watches = expressions
+        self.save()
+
+    def save(self):
+        self.dirty = True
+        self.mutations += 1
+        self.generation += 1
+        generation = self.generation
+        delay = sublime.load_settings('SublimeAnarchyDebug.sublime-settings').get('breakpoint_save_delay', 1000)
+        sublime.set_timeout(lambda: self._flush_generation(generation), delay)
+
+    def _flush_generation(self, generation):
+        # only the last change of a burst writes
+        if generation == self.generation:
+            self.flush()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        project_data = self.window.project_data() or {}
+        if 'settings' not in project_data:
+            project_data['settings'] = {}
+        if 'SublimeAnarchyDebug' not in project_data['settings']:
+            project_data['settings']['SublimeAnarchyDebug'] = {}
+        project_data['settings']['SublimeAnarchyDebug']['breakpoints'] = self.breakpoints
+        if self.watches or 'watches' in project_data['settings']['SublimeAnarchyDebug']:
+            project_data['settings']['SublimeAnarchyDebug']['watches'] = self.watches
+        self.window.set_project_data(project_data)
+        self.mtime = self._project_mtime()
+        self.dirty = False
+        self.writes += 1
+
+    def stats(self):
+        return { "mutations": self.mutations, "writes": self.writes, "saved": self.mutations - self.writes }
+
+
+def breakpoint_store(window):
+    store = stores.get(window.id(), None)
+    if not store:
+        store = BreakpointStore(window)
+        stores[window.id()] = store
+    return store
+
+def flush_all():
+    for store in stores.values():
+        store.flush()
+
+def plugin_unloaded():
+    flush_all()
@@ -1,78 +1,459 @@
 import sublime_plugin
 import sublime
 import json
-import random
+import socket
 import xmlrpc.client
-from http.client import CannotSendRequest, ResponseNotReady
 import threading
-from contextlib import contextmanager
+import html
+import re
 
 import os
+import subprocess
+import tempfile
 import xmlrpc.client
-from time import sleep
+from time import sleep, perf_counter
 
 from subprocess import Popen
 from datetime import datetime
 
-debuggers = {} # key = window.id, value lldb proxy
+from .lldb_rpc import LLDBProxy, session_url
+from .breakpoints import breakpoint_store
+from .stop_cache import StopCache
+from .executor import command_executor, shutdown_executor
+from .output_buffer import OutputBuffer
+from .sessions import Bridge, Session, SessionManager
+from .perf import Timings, ui_timings, timed, format_summary
+from .lldb_format import format_counter
+from .sampling import Profile
+
+debuggers = {} # key = window.id, value lldb proxy of the active session
 output_callbacks = {} # key = window.id, value set of callback funcs
 status_callbacks = {} # key = window.id, value set of callback funcs
 
-debug_status = {}
+debug_status = {} # key = window.id, value status of the active session
+stop_caches = {} # key = lldb proxy of a session, value StopCache with the snapshot of the current stop
+output_buffers = {} # key = window.id, value OutputBuffer of program output not yet shown
+breakpoint_ids = {} # key = lldb proxy of a session, value dict (file, line) -> breakpoint as set in lldb, with its lldb id
+sessions = SessionManager()
+ended_timings = {} # key = window.id, value Timings of the bridge calls of sessions that ended
+counter_samples = {} # key = lldb proxy of a session, value (time, dict breakpoint id -> hits) of the last counter pull
+counter_stats = {} # key = window.id, value dict (file, line) -> counter statistics of all sessions
+counter_polls = {} # key = window.id, value token of the running counter poll
+counter_phantoms = {} # key = view.id, value PhantomSet with the counter annotations
+profiles = {} # key = window.id, value Profile of the last sampling run
+watch_values = {} # key = lldb proxy of a session, value (stop id, watch values of the stop before, watch values of this stop)
+
+warm_bridge = {} # idle pre-started bridge: process, url and the config it was started with
+warm_bridge_lock = threading.Lock()
+bridge_count = 0
+BRIDGE_LAUNCH_ATTEMPTS = 3
 
 def plugin_loaded():
     global settings
     settings = sublime.load_settings('SublimeAnarchyDebug.sublime-settings')
+    if settings.get('warm_bridge', False):
+        sublime.set_timeout_async(_prewarm_bridge, 0)
 
 def plugin_unloaded():
-    for key, debugger in debuggers.items():
-        debugger.shutdown_server()
-
-@contextmanager
-def retry():
-    while True:
-        try:
-            yield
-        except CannotSendRequest:
-            sleep(0.2)
-            continue
-        except ResponseNotReady:
-            sleep(0.2)
-            continue
-        break
+    for bridge in sessions.bridges():
+        for session in list(bridge.sessions.values()):
+            if session.attached:
+                session.lldb.detach()
+        if not bridge.remote:
+            bridge.lldb.shutdown_server()
+    bridge = _take_warm_bridge()
+    if bridge:
+        _discard_bridge(bridge[0])
 
 # lldb query functions
 def lldb_update_status(window):
     lldb = debuggers[window.id()]
-    with retry():
-        try:
-            status = lldb.get_status()
-        except xmlrpc.client.Fault:
-            status = None
-        except ConnectionRefusedError:
-            status = "LLDB exited"
+    snapshot = stop_cache(window).snapshot
+    if snapshot is not None:
+        # still stopped at the same place, nothing can have changed
+        lldb_dispatch_status(window, snapshot['status'])
+        return
+    try:
+        status = lldb.get_status()
+    except xmlrpc.client.Fault:
+        status = None
+    except ConnectionRefusedError:
+        status = "LLDB exited"
+    session = sessions.active(window.id())
+    if session:
+        _deliver_status(session, status)
+
+def lldb_dispatch_status(window, status, snapshot=None):
     if window.id() not in debug_status:
         debug_status[window.id()] = "unknown"
 
     if status != debug_status[window.id()]:
         print("state change", debug_status[window.id()], '->', status)
         debug_status[window.id()] = status
-        for callback in status_callbacks[window.id()]:
+        stop_cache(window).invalidate()
+        if is_stopped(status):
+            try:
+                lldb_fetch_snapshot(window, snapshot=snapshot)
+            except xmlrpc.client.Fault as e:
+                print('Could not fetch stop snapshot', e)
+        # views add their callbacks from the UI thread, and the session may end meanwhile
+        for callback in list(status_callbacks.get(window.id(), [])):
             try:
                 callback(window, status)
             except Exception as e:
                 print('Exception', e)
 
-def lldb_update_console(window):
+def lldb_update_console(window, lldb=None):
+    if not lldb:
+        lldb = debuggers[window.id()]
+    chunk_size = settings.get('stdout_chunk_size', 65536)
+    # more than a full buffer per poll would only be dropped again
+    for i in range(max(1, settings.get('console_buffer_size', 1048576) // chunk_size)):
+        try:
+            stdout_buffer = lldb.get_stdout(chunk_size)
+        except xmlrpc.client.Fault:
+            # bridge without chunked output
+            lldb_dispatch_output(window, lldb.get_stdout())
+            return
+        lldb_dispatch_output(window, stdout_buffer)
+        if not stdout_buffer or len(stdout_buffer) < chunk_size:
+            return
+
+def lldb_dispatch_output(window, stdout_buffer):
+    if stdout_buffer is None or len(stdout_buffer) == 0:
+        return
+    buf = output_buffers.get(window.id(), None)
+    if not buf:
+        buf = OutputBuffer(settings.get('console_buffer_size', 1048576))
+        output_buffers[window.id()] = buf
+    if buf.append(stdout_buffer):
+        # collect output for a moment, then hand it to the UI in one go
+        sublime.set_timeout(lambda: _drain_output(window), 50)
+
+def _drain_output(window):
+    buf = output_buffers.get(window.id(), None)
+    if not buf:
+        return
+    stdout_buffer, dropped = buf.take()
+    if dropped:
+        stdout_buffer = "[{} characters of output dropped]\n".format(dropped) + stdout_buffer
+    for callback in list(output_callbacks.get(window.id(), [])):
+        try:
+            callback(window, stdout_buffer)
+        except Exception:
+            pass
+
+def lldb_console_message(window, message):
+    print('LLDB:', message)
+    for view in window.views():
+        if view.name() == "LLDB Console":
+            view.run_command("update_lldb_console", { "data": "LLDB: " + message + "\n" })
+
+def lldb_wait_for_events(bridge, timeout):
+    # blocks on the bridge until something happens or the timeout runs out,
+    # raises xmlrpc.client.Fault if the bridge has no event support. Events
+    # of multiplexed sessions carry the session id.
+    for event in bridge.events.wait_for_event(timeout) or []:
+        _dispatch_event(bridge, event)
+
+def _dispatch_event(bridge, event):
+    session = bridge.sessions.get(event.get('session', None), None)
+    if not session:
+        return
+    if event['type'] == 'status':
+        _deliver_status(session, event['status'], snapshot=event.get('snapshot', None))
+    elif event['type'] == 'stdout':
+        lldb_dispatch_output(session.window, event['data'])
+
+def _deliver_status(session, status, snapshot=None):
+    # the active session updates the UI, the others only announce changes
+    window = session.window
+    if sessions.active(window.id()) is session:
+        previous = debug_status.get(window.id(), session.status)
+        lldb_dispatch_status(window, status, snapshot=snapshot)
+    else:
+        previous = session.status
+        if status != previous:
+            print("state change", session.name, previous, '->', status)
+            session_cache(session.lldb).invalidate()
+            if status:
+                lldb_console_message(window, "{}: {}".format(session.name, status))
+    session.status = status
+    if status != previous and status and status.startswith('exited'):
+        _stop_session(session)
+
+
+def is_stopped(status):
+    if not status:
+        return False
+    return status.startswith('stopped') or status.startswith('crashed') or status.startswith('plan_complete')
+
+def lldb_fetch_snapshot(window, snapshot=None):
+    # one bundle with everything the stop handlers need:
+    #
+    # {
+    #     "version": 1,
+    #     "stop_id": 42,
+    #     "status": "stopped,breakpoint",
+    #     "threads": { <get_backtrace(None, 0, depth) result> },
+    #     "location": { "file": <path>, "line": 12 },
+    #     "locals": { "thread": <thread id>, "frame": 0, "variables": [ <get_variables() result> ] }
+    # }
+    #
+    # location is the first frame with source of the selected thread, even
+    # if it is deeper than the frames included in threads
     lldb = debuggers[window.id()]
-    with retry():
-        stdout_buffer = lldb.get_stdout()
-    if stdout_buffer is not None and len(stdout_buffer) > 0:
-        for callback in output_callbacks[window.id()]:
-            try:
-                callback(window, stdout_buffer)
-            except Exception:
-                pass
+    if snapshot is None:
+        depth = settings.get('stack_frame_depth', 20)
+        try:
+            snapshot = lldb.get_stop_snapshot(depth)
+        except xmlrpc.client.Fault:
+            snapshot = _build_snapshot(window, lldb, depth)
+    if is_stopped(snapshot['status']):
+        stop_cache(window).set_snapshot(snapshot)
+    return snapshot
+
+def lldb_snapshot(window):
+    snapshot = stop_cache(window).get_snapshot()
+    if snapshot is None:
+        snapshot = lldb_fetch_snapshot(window)
+    return snapshot
+
+def lldb_invalidate(window):
+    # the target is about to move, forget everything about the current stop
+    stop_cache(window).invalidate()
+
+def stop_cache(window):
+    return session_cache(debuggers.get(window.id(), None))
+
+def selected_expression(window):
+    # the selection is the most likely expression
+    view = window.active_view()
+    if view and len(view.sel()) > 0 and '\n' not in view.substr(view.sel()[0]):
+        return view.substr(view.sel()[0])
+    return ""
+
+def watch_expressions(window):
+    return breakpoint_store(window).watch_expressions()
+
+def set_watch_expressions(window, expressions):
+    # saved with the breakpoints, after the same quiet period
+    breakpoint_store(window).set_watch_expressions(expressions)
+
+def lldb_watches(window):
+    # all watch expressions in one call per stop, evaluated in the frame the
+    # locals are shown for. Results are
+    #
+    # [ { "expression": "i", "value": "42", "type": "Int", "error": None, "changed": True }, ... ]
+    expressions = watch_expressions(window)
+    if not expressions:
+        return []
+    lldb = debuggers[window.id()]
+    snapshot = lldb_snapshot(window)
+
+    def evaluate():
+        results = lldb_evaluate(window, expressions)
+
+        # changed is relative to the previous stop, also when the list was edited in between
+        stop_id, before, values = watch_values.get(lldb, (None, {}, {}))
+        if stop_id != snapshot['stop_id']:
+            before = values
+        values = {}
+        for expression, result in zip(expressions, results):
+            result['expression'] = expression
+            result['changed'] = expression in before and before[expression] != result['value']
+            values[expression] = result['value']
+        watch_values[lldb] = (snapshot['stop_id'], before, values)
+        return results
+    return stop_cache(window).get(('watches', tuple(expressions)), evaluate)
+
+def lldb_evaluate(window, expressions):
+    # in the frame the locals are shown for, each expression gets watch_timeout seconds
+    lldb = debuggers[window.id()]
+    snapshot = lldb_snapshot(window)
+    if snapshot['locals']:
+        thread_id, frame = snapshot['locals']['thread'], snapshot['locals']['frame']
+    else:
+        thread = selected_thread(snapshot)
+        thread_id, frame = (thread['id'] if thread else None), 0
+    timeout = settings.get('watch_timeout', 0.5)
+    try:
+        return lldb.evaluate_expressions(expressions, thread_id, frame, timeout)
+    except xmlrpc.client.Fault:
+        return _evaluate_with_commands(lldb, expressions, timeout)
+
+def _evaluate_with_commands(lldb, expressions, timeout):
+    # bridge without evaluate_expressions, lldb's expression command in one batch
+    calls = [('execute_lldb_command', ("expression -t {} -- {}".format(int(timeout * 1000000), expression),)) for expression in expressions]
+    results = []
+    for result in lldb.batch(calls, errors=True):
+        if isinstance(result, xmlrpc.client.Fault):
+            results.append({ "value": None, "type": None, "error": result.faultString })
+        elif not result['succeeded']:
+            results.append({ "value": None, "type": None, "error": result['error'].strip() })
+        else:
+            match = re.match(r'\((.*?)\) \$\w+ = (.*)', result['output'].strip(), re.DOTALL)
+            if match:
+                results.append({ "value": match.group(2), "type": match.group(1), "error": None })
+            else:
+                results.append({ "value": result['output'].strip(), "type": None, "error": None })
+    return results
+
+def lldb_update_counters(window):
+    # one get_counters call per session for all its counting breakpoints,
+    # hits per second are the difference to the previous pull
+    stats = {}
+    now = perf_counter()
+    for session in sessions.for_window(window.id()):
+        counters = [bp for bp in list(breakpoint_ids.get(session.lldb, {}).values()) if bp.get('counter', False) and bp['id'] is not None]
+        if not counters:
+            continue
+        try:
+            results = session.lldb.get_counters([bp['id'] for bp in counters])
+        except (xmlrpc.client.Fault, ConnectionRefusedError):
+            continue
+        last_time, last_hits = counter_samples.get(session.lldb, (None, {}))
+        hits = {}
+        for bp, result in zip(counters, results):
+            hits[bp['id']] = result['hits']
+            stat = stats.setdefault((bp['file'], bp['line']), { "hits": 0, "rate": 0.0, "paired": 0, "paired_time": 0.0 })
+            stat['hits'] += result['hits']
+            stat['paired'] += result.get('paired', 0)
+            stat['paired_time'] += result.get('paired_time', 0.0)
+            if last_time is not None and bp['id'] in last_hits:
+                stat['rate'] += max(0, result['hits'] - last_hits[bp['id']]) / (now - last_time)
+        counter_samples[session.lldb] = (now, hits)
+    counter_stats[window.id()] = stats
+    return stats
+
+def start_counter_poll(window):
+    if window.id() in counter_polls:
+        return
+    token = object()
+    counter_polls[window.id()] = token
+    sublime.set_timeout_async(lambda: _poll_counters(window, token), settings.get('counter_interval', 1000))
+
+def _poll_counters(window, token):
+    # runs until the last session of the window ended (or a new poll took over)
+    if counter_polls.get(window.id(), None) is not token:
+        return
+    if any(bp.get('counter', False) for bp in breakpoint_store(window).all()):
+        lldb_update_counters(window)
+        sublime.set_timeout(lambda: update_counter_markers(window), 0)
+    sublime.set_timeout_async(lambda: _poll_counters(window, token), settings.get('counter_interval', 1000))
+
+def session_cache(lldb):
+    cache = stop_caches.get(lldb, None)
+    if not cache:
+        cache = StopCache()
+        stop_caches[lldb] = cache
+    return cache
+
+def _build_snapshot(window, lldb, depth):
+    # bridge without get_stop_snapshot, assemble it from the single queries
+    snapshot = {
+        "version": 1,
+        "stop_id": stop_cache(window).next_stop_id(),
+        "status": lldb.get_status(),
+        "threads": {},
+        "location": None,
+        "locals": None
+    }
+    if not is_stopped(snapshot['status']):
+        return snapshot
+
+    snapshot['threads'] = lldb_get_backtrace(lldb, None, 0, depth)
+    thread = selected_thread(snapshot)
+    if thread:
+        snapshot['location'] = source_location(thread['bt'])
+        if snapshot['location'] is None and thread.get('frame_count', 0) > len(thread['bt']):
+            snapshot['location'] = source_location(lldb.get_backtrace_for_selected_thread()['bt'])
+        frame = toplevel_frame(thread)
+        snapshot['locals'] = {
+            "thread": thread['id'],
+            "frame": frame,
+            "variables": lldb_get_variables(lldb, thread['id'], frame)
+        }
+    return snapshot
+
+def lldb_get_backtrace(lldb, thread_ids, start, count):
+    # frames start to start + count (all if count is 0) of the threads with
+    # the ids in thread_ids (all threads if None), every thread has the
+    # total number of frames in frame_count
+    try:
+        return lldb.get_backtrace(thread_ids, start, count)
+    except xmlrpc.client.Fault:
+        pass
+
+    bt = lldb.get_backtrace()
+    for thread_id, info in list(bt.items()):
+        if thread_ids is not None and info['id'] not in thread_ids:
+            del bt[thread_id]
+            continue
+        info['frame_count'] = len(info['bt'])
+        if count > 0:
+            info['bt'] = info['bt'][start:start + count]
+        else:
+            info['bt'] = info['bt'][start:]
+    return bt
+
+def lldb_expand_thread(window, thread_id):
+    # fetch the frames of a thread that were left out of the stop snapshot
+    lldb = debuggers[window.id()]
+    threads = lldb_snapshot(window)['threads']
+    for key, thread in threads.items():
+        if str(thread['id']) != str(thread_id) or thread.get('frame_count', 0) <= len(thread['bt']):
+            continue
+        start = len(thread['bt'])
+        count = thread['frame_count'] - start
+        bt = stop_cache(window).get(('backtrace', key, start, count), lambda: lldb_get_backtrace(lldb, [thread['id']], start, count))
+        for info in bt.values():
+            threads[key] = dict(thread, bt=thread['bt'] + info['bt'])
+
+def lldb_get_variables(lldb, thread_id, frame):
+    # locals as shallow nodes:
+    # { "handle": <id>, "name": "a", "type": "Int", "value": "1", "children": 0 }
+    # children of a node are fetched with get_variable_children(handle, start, count)
+    try:
+        return lldb.get_variables(thread_id, frame)
+    except xmlrpc.client.Fault:
+        pass
+
+    variables = lldb.get_local_variables(thread_id, frame)
+    return [
+        { "handle": None, "name": name, "type": None, "value": value, "children": 0 }
+        for name, value in sorted(variables.items())
+    ]
+
+def lldb_load_children(window, node):
+    # append the next page of children to node['loaded'], the nodes live in
+    # the stop snapshot so every page is fetched once per stop
+    lldb = debuggers[window.id()]
+    loaded = node.get('loaded', [])
+    if node['handle'] is None or len(loaded) >= node['children']:
+        return
+    start = len(loaded)
+    count = settings.get('variable_page_size', 100)
+    page = stop_cache(window).get(('children', node['handle'], start, count), lambda: lldb.get_variable_children(node['handle'], start, count))
+    node['loaded'] = loaded + page
+
+def source_location(frames):
+    for frame in frames:
+        if 'file' in frame and frame['line'] != 0:
+            return { "file": frame['file'], "line": frame['line'] }
+    return None
+
+def selected_thread(snapshot):
+    for info in snapshot['threads'].values():
+        if info['selected']:
+            return info
+    return None
+
+def toplevel_frame(thread):
+    for frame_id, frame in enumerate(thread['bt']):
+        if 'function' in frame:
+            return frame_id
+    return -1
 
 
 # default callbacks for query functions
@@ -86,71 +467,379 @@ def main_status_callback(window, status):
         return
 
     lldb = debuggers[window.id()]
+    caption = 'LLDB: ' + status
+    session = sessions.active(window.id())
+    if session and len(sessions.for_window(window.id())) > 1:
+        caption = 'LLDB [{}]: {}'.format(session.name, status)
     for view in window.views():
-        view.set_status('lldb', 'LLDB: ' + status)
-    if status.startswith('stopped') or status.startswith('crashed') or status.startswith('plan_complete'):
+        view.set_status('lldb', caption)
+    if is_stopped(status):
         update_run_marker(window, lldb=lldb)
-    if status.startswith('exited'):
-        lldb.shutdown_server()
 
 
-def debugger_thread(p, port, window):
+def _wait_for_bridge(p, lldb, timeout):
+    # the bridge imports lldb before it starts listening, so the first call
+    # that gets through signals readiness
+    deadline = perf_counter() + timeout
+    while True:
+        try:
+            lldb.get_status()
+            return
+        except xmlrpc.client.Fault:
+            return
+        except ConnectionRefusedError:
+            if (p and p.poll() is not None) or perf_counter() > deadline:
+                raise
+        sleep(0.02)
+
+def _wait_for_entry(session, attached=False):
+    # wait for the target to stop at the entry point, or wherever it was
+    # when attaching, pushed by the bridge if it supports events, else polled.
+    # The status is checked before every wait, the stop may have been pushed
+    # before the first one. Output and the events of other sessions of the
+    # bridge are passed on.
+    bridge = session.bridge
+    events = None if bridge.looping else bridge.events
+    entry = ["stopped,signal", "stopped,breakpoint"]
+    def entered(status):
+        return is_stopped(status) if attached else status in entry
+    while not entered(session.lldb.get_status()):
+        if not events:
+            sleep(0.05)
+            continue
+        try:
+            for event in events.wait_for_event(settings.get('event_timeout', 5.0)) or []:
+                if event['type'] != 'status' or event.get('session', None) != session.key:
+                    _dispatch_event(bridge, event)
+                elif entered(event['status']):
+                    return
+        except xmlrpc.client.Fault:
+            events = None
+
+def debug_targets(window):
+    # the debug setting is one target or a list of targets with a name each
+    targets = window.project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('debug', {})
+    if isinstance(targets, dict):
+        targets = [targets] if targets else []
+    return [(target_name(target), target) for target in targets]
+
+def target_name(target):
+    if target.get('name', None):
+        return target['name']
+    if target.get('executable', None):
+        return os.path.basename(target['executable'])
+    return str(target.get('attach', target.get('connect', '')))
+
+def list_processes(bridge_url=None):
+    # processes to attach to, a bridge on another machine is asked for its own
+    if bridge_url:
+        return _session_proxy(bridge_url, remote=True).list_processes()
+    output = subprocess.check_output(['ps', '-axo', 'pid=,comm='], universal_newlines=True)
+    processes = []
+    for line in output.splitlines():
+        pid, _, command = line.strip().partition(' ')
+        if pid.isdigit() and int(pid) != os.getpid():
+            path = _process_executable(int(pid), command.strip())
+            name = os.path.basename(path) if path else command.strip()
+            processes.append({ "pid": int(pid), "name": name, "path": path })
+    return processes
+
+def _process_executable(pid, command):
+    # comm is the full path on macOS, on Linux only the name cut to 15
+    # characters, None if the executable is unknown (lldb finds it by pid)
+    try:
+        path = os.readlink('/proc/{}/exe'.format(pid))
+        # replaced on disk since it was started
+        return None if path.endswith(' (deleted)') else path
+    except OSError:
+        pass
+    if os.path.isabs(command):
+        return command
+    return None
+
+def _session_proxy(url, remote=False):
+    # bridges on other machines get compressed requests
+    compress_threshold = settings.get('rpc_compress_threshold', 1400) if remote else None
+    return LLDBProxy(url, pool_size=settings.get('rpc_pool_size', 2), retries=settings.get('rpc_retries', 3), compress_threshold=compress_threshold)
+
+def _open_session(window, name, target):
+    # a new target on a bridge of the window that can take more, else a
+    # bridge of its own. A bridge given by url is never launched, all
+    # targets using it share it.
+    remote = target.get('bridge', None)
+    if settings.get('shared_bridge', True) or remote:
+        for bridge in sessions.bridges(window.id()):
+            if bridge.closing or bridge.multiplexed is False or bridge.remote != remote:
+                continue
+            try:
+                key = str(bridge.lldb.add_session())
+            except xmlrpc.client.Fault:
+                bridge.multiplexed = False
+                continue
+            except ConnectionRefusedError:
+                continue
+            bridge.multiplexed = True
+            return Session(window, name, bridge, key, _session_proxy(session_url(bridge.url, key), remote=bool(remote)))
+
+    if remote:
+        if remote in [bridge.remote for bridge in sessions.bridges(window.id())]:
+            lldb_console_message(window, "the debug bridge at {} runs one target only".format(remote))
+            return None
+        p, url = None, remote
+    else:
+        warm = _take_warm_bridge()
+        if warm:
+            p, url = warm
+        else:
+            p, url = _launch_bridge(os.path.dirname(window.project_file_name()))
+        #p = None
+        if settings.get('warm_bridge', False):
+            sublime.set_timeout_async(_prewarm_bridge, 0)
+
+    attempt = 1
+    while True:
+        events = None
+        if settings.get('event_notifications', True):
+            events = _session_proxy(url, remote=bool(remote))
+        bridge = Bridge(p, url, _session_proxy(url, remote=bool(remote)), events, remote=remote)
+        try:
+            _wait_for_bridge(p, bridge.lldb, settings.get('bridge_start_timeout', 30))
+            return Session(window, name, bridge, None, bridge.lldb)
+        except ConnectionRefusedError:
+            _close_bridge(bridge)
+        if p and p.poll() is not None and attempt < BRIDGE_LAUNCH_ATTEMPTS:
+            # most likely the port was taken between _free_port and the
+            # bridge binding it, try again with another one
+            print("LLDB Debug server exited during startup, launching it again")
+            p, url = _launch_bridge(os.path.dirname(window.project_file_name()))
+            attempt += 1
+            continue
+        print("LLDB Debug server did not come up")
+        if p:
+            p.kill()
+            p.wait()
+        return None
+
+def _prepare_target(lldb, target, project_path):
+    # launch the executable, attach to a running process or connect to a
+    # remote debug server (lldb-server, gdbserver or anything gdb-remote)
+    executable = target.get('executable', None)
+    if executable:
+        executable = executable.replace('${project_path}', project_path)
+    if 'connect' in target:
+        lldb.connect_remote(executable, target['connect'])
+    elif 'attach' in target:
+        # a number is a pid, anything else a process name
+        attach = target['attach']
+        if isinstance(attach, int) or str(attach).isdigit():
+            lldb.attach(executable, int(attach), None, False)
+        else:
+            lldb.attach(executable, None, attach, target.get('wait_for', False))
+    else:
+        lldb.prepare(
+            executable,
+            target.get('params', []),
+            target.get('environment', None),
+            target.get('path', None),
+            target.get('working_dir', project_path).replace('${project_path}', project_path)
+        )
+
+def _discard_session(session):
+    # a session that never got a target
+    bridge = session.bridge
+    if session.key is not None:
+        bridge.lldb.remove_session(session.key)
+        session.lldb.close()
+        return
+    if bridge.process:
+        bridge.lldb.shutdown_server()
+        bridge.process.wait()
+    if not bridge.looping:
+        _close_bridge(bridge)
+
+def _close_bridge(bridge):
+    # the keep-alive connections of a bridge whose event loop ended, a
+    # bridge that keeps running (remote or shared) would hold them open
+    bridge.lldb.close()
+    if bridge.events:
+        bridge.events.close()
+
+def debugger_thread(window, name, target, start_time):
     global settings
-    sleep(0.5)
 
-    project_settings = window.project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('debug', {})
-    lldb = xmlrpc.client.ServerProxy('http://localhost:' + str(port), allow_none=True)
+    session = _open_session(window, name, target)
+    if not session:
+        return
+    bridge = session.bridge
+    lldb = session.lldb
+    session.attached = 'attach' in target or 'connect' in target
 
     project_path = os.path.dirname(window.project_file_name())
-    with retry():
-        lldb.prepare(
-            project_settings.get('executable').replace('${project_path}', project_path),
-            project_settings.get('params', []),
-            project_settings.get('environment', None),
-            project_settings.get('path', None),
-            project_settings.get('working_dir', project_path).replace('${project_path}', project_path)
-        )
-    debuggers[window.id()] = lldb
-    status_callbacks[window.id()] = set()
-    status_callbacks[window.id()].add(main_status_callback)
-    output_callbacks[window.id()] = set()
-    output_callbacks[window.id()].add(main_output_callback)
-
-    # start the app
-    status = "unknown"
-    while status not in ["stopped,signal", "stopped,breakpoint"]:
-        with retry():
-            status = lldb.get_status()
-        sleep(0.5)
+    try:
+        _prepare_target(lldb, target, project_path)
+    except xmlrpc.client.Fault as e:
+        lldb_console_message(window, "could not start {}: {}".format(name, e.faultString))
+        _discard_session(session)
+        return
+    if not sessions.for_window(window.id()):
+        status_callbacks[window.id()] = set()
+        status_callbacks[window.id()].add(main_status_callback)
+        output_callbacks[window.id()] = set()
+        output_callbacks[window.id()].add(main_output_callback)
+    bridge.sessions[session.key] = session
+    sessions.add(session)
+    activate_session(window, session, refresh=len(sessions.for_window(window.id())) > 1)
+
+    # start the app, once the event loop of the bridge runs it gets all events
+    _wait_for_entry(session, attached=session.attached)
 
     if settings.get('auto_show_lldb_console', True):
         window.run_command('atdebug_console', { "show": True })
+    lldb_console_message(window, "{} ready after {:.2f}s".format(name, perf_counter() - start_time))
 
     # load saved breakpoints
     atlldb.load_breakpoints(window, lldb)
-
-    with retry():
-        lldb.start()
-
-    # polling loop
-    debug_status[window.id()] = "stopped,signal"
+    start_counter_poll(window)
+
+    lldb.start()
+
+    session.status = "stopped,signal"
+    if sessions.active(window.id()) is session:
+        debug_status[window.id()] = session.status
+    if not bridge.looping:
+        bridge.looping = True
+        bridge_event_loop(bridge)
+
+def bridge_event_loop(bridge):
+    # one loop for all sessions of a bridge, the long poll gets its own
+    # connection so it does not block the proxies shared with the UI. Falls
+    # back to polling on old bridges.
+    use_events = bridge.events is not None
     try:
-        while True:
+        # a bridge that was not launched here is left running
+        while bridge.process or bridge.sessions:
+            if use_events:
+                try:
+                    lldb_wait_for_events(bridge, settings.get('event_timeout', 5.0))
+                    continue
+                except xmlrpc.client.Fault as e:
+                    if bridge.events.supports('wait_for_event'):
+                        # an error on the bridge side, events still work
+                        print("LLDB event wait failed", e)
+                        sleep(1)
+                        continue
+                    print("LLDB bridge does not support events, falling back to polling")
+                    use_events = False
             sleep(1)
-            lldb_update_status(window)
-            lldb_update_console(window)
-    except Exception as e:
-        print("exception", e)
+            for session in list(bridge.sessions.values()):
+                _poll_session(session)
     except ConnectionRefusedError:
         print("LLDB Debug server down")
+    except Exception as e:
+        print("exception", e)
 
-    _kill_lldb(window)
-    if p:
-        p.wait()
+    for session in list(bridge.sessions.values()):
+        _end_session(session)
+    _close_bridge(bridge)
+    if bridge.process:
+        bridge.process.wait()
+
+def _poll_session(session):
+    window = session.window
+    if sessions.active(window.id()) is session:
+        lldb_update_status(window)
+    else:
+        try:
+            status = session.lldb.get_status()
+        except xmlrpc.client.Fault:
+            status = None
+        _deliver_status(session, status)
+    lldb_update_console(window, session.lldb)
 
+def activate_session(window, session, refresh=True):
+    previous = sessions.active(window.id())
+    if previous is session:
+        return
+    if previous:
+        previous.status = debug_status.get(window.id(), previous.status)
+    sessions.activate(session)
+    debuggers[window.id()] = session.lldb
+    debug_status[window.id()] = session.status
+    if not refresh:
+        return
+
+    # stack view, markers and status bar follow the active session
+    def show():
+        status = debug_status.get(window.id(), None)
+        if is_stopped(status):
+            try:
+                lldb_snapshot(window)
+            except xmlrpc.client.Fault as e:
+                print('Could not fetch stop snapshot', e)
+        else:
+            update_run_marker(window)
+        for callback in list(status_callbacks.get(window.id(), [])):
+            try:
+                callback(window, status)
+            except Exception as e:
+                print('Exception', e)
+    sublime.set_timeout_async(show, 0)
+
+def _stop_session(session):
+    # the last session of a bridge takes it down, the others only their
+    # target. Attached processes keep running.
+    if session.stopping:
+        return
+    session.stopping = True
+    bridge = session.bridge
+    try:
+        if session.attached:
+            try:
+                session.lldb.detach()
+            except xmlrpc.client.Fault as e:
+                print('Could not detach', session.name, e)
+        if len(bridge.sessions) > 1 or bridge.remote:
+            if session.key is not None:
+                bridge.lldb.remove_session(session.key)
+            elif not session.attached:
+                session.lldb.stop()
+            _end_session(session)
+        else:
+            bridge.closing = True
+            bridge.lldb.shutdown_server()
+    except ConnectionRefusedError:
+        _end_session(session)
+
+def _end_session(session):
+    window = session.window
+    was_active = sessions.active(window.id()) is session
+    if not sessions.remove(session):
+        return
+    session.bridge.sessions.pop(session.key, None)
+    cache = stop_caches.pop(session.lldb, None)
+    if cache:
+        print("LLDB: {} stop cache hits {hits}, misses {misses}, invalidations {invalidations}".format(session.name, **cache.stats()))
+    breakpoint_ids.pop(session.lldb, None)
+    counter_samples.pop(session.lldb, None)
+    watch_values.pop(session.lldb, None)
+    timings = ended_timings.setdefault(window.id(), Timings())
+    timings.merge(session.lldb.timings)
+    if not session.bridge.sessions and session.bridge.events:
+        timings.merge(session.bridge.events.timings)
+    if session.lldb is not session.bridge.lldb:
+        # the bridge's own proxy is closed when its event loop ends
+        session.lldb.close()
+
+    remaining = sessions.for_window(window.id())
+    if not remaining:
+        _kill_lldb(window)
+        return
+    lldb_console_message(window, "{} ended".format(session.name))
+    if was_active:
+        activate_session(window, remaining[0])
 
 def _kill_lldb(window):
-    # so the debug server exited or crashed
+    # so the last debug session of the window ended
     if window.id() in debuggers:
         del debuggers[window.id()]
     if window.id() in debug_status:
@@ -159,71 +848,197 @@ def _kill_lldb(window):
         del status_callbacks[window.id()]
     if window.id() in output_callbacks:
         del output_callbacks[window.id()]
+    shutdown_executor(window)
+    buf = output_buffers.pop(window.id(), None)
+    if buf and buf.total_dropped:
+        print("LLDB: dropped {} characters of program output".format(buf.total_dropped))
+    store = breakpoint_store(window)
+    store.flush()
+    print("LLDB: breakpoint changes {mutations}, project writes {writes}, saved {saved}".format(**store.stats()))
+    counter_polls.pop(window.id(), None)
+    counter_stats.pop(window.id(), None)
 
     for view in window.views():
         view.erase_status('lldb')
-    update_run_marker(view.window())
+    update_run_marker(window)
+    sublime.set_timeout(lambda: update_counter_markers(window), 0)
     window.run_command('atdebug_console', { "show": False })
 
+def _free_port():
+    # the port is free now, but it is only taken once the bridge binds it.
+    # A bridge that bound port 0 itself and reported the port would close
+    # that window, the bridge of the lldb_bridge submodule takes the port
+    # as an argument, so _open_session launches it again if it exits.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def _bridge_config():
+    return (settings.get('lldb_python_path'), settings.get('bridge_transport', 'xmlrpc'))
+
+def _launch_bridge(cwd):
+    global bridge_count
+    bridge_count += 1
+    if settings.get('bridge_transport', 'xmlrpc') == 'jsonlines':
+        socket_path = os.path.join(tempfile.gettempdir(), 'sublime-lldb-{}-{}.sock'.format(os.getpid(), bridge_count))
+        address = 'unix:' + socket_path
+        url = 'unix://' + socket_path
+    else:
+        address = str(_free_port())
+        url = 'http://localhost:' + address
+    lldb_server_executable = os.path.join(sublime.packages_path(), "SublimeAnarchyDebug", "lldb_bridge", "lldb_server.py")
+    args = ['/usr/bin/python', lldb_server_executable, settings.get('lldb_python_path'), address]
+    return Popen(args, cwd=cwd), url
+
+def _prewarm_bridge():
+    # start a bridge that imports lldb in the background and waits for
+    # the next _start_debugger to hand it a target
+    with warm_bridge_lock:
+        if warm_bridge:
+            return
+        p, url = _launch_bridge(os.path.expanduser('~'))
+        warm_bridge.update(process=p, url=url, config=_bridge_config())
+
+def _take_warm_bridge():
+    with warm_bridge_lock:
+        if not warm_bridge:
+            return None
+        p, url, config = warm_bridge['process'], warm_bridge['url'], warm_bridge['config']
+        warm_bridge.clear()
+    if p.poll() is not None or config != _bridge_config():
+        _discard_bridge(p)
+        return None
+    return p, url
+
+def _discard_bridge(p):
+    if p.poll() is None:
+        p.terminate()
+    p.wait()
+
 class atdebug(sublime_plugin.WindowCommand):
 
-    def _start_debugger(self):
-        self._stop_debugger()
-        path = os.path.dirname(self.window.project_file_name())
-        port = random.randint(12000,13000)
-        #port = 12345
-        lldb_server_executable = os.path.join(sublime.packages_path(), "SublimeAnarchyDebug", "lldb_bridge", "lldb_server.py")
-        args = ['/usr/bin/python', lldb_server_executable, settings.get('lldb_python_path'), str(port)]
-        p = Popen(args, cwd=path)
-        #p = None
-        threading.Thread(target=debugger_thread, name='debugger_thread', args=(p, port, self.window)).start()
+    def _start_debugger(self, target=None):
+        targets = debug_targets(self.window)
+        if target is None and len(targets) > 1:
+            names = [name for name, config in targets]
+            def on_done(index):
+                if index >= 0:
+                    self._start_debugger(names[index])
+            self.window.show_quick_panel(names, on_done)
+            return
 
-    def _stop_debugger(self):
-        lldb = debuggers.get(self.window.id(), None)
-        if lldb:
-            with retry():
-                try:
-                    lldb.shutdown_server()
-                except ConnectionRefusedError:
-                    _kill_lldb(self.window)
+        for name, config in targets:
+            if target is None or name == target:
+                break
+        else:
+            return
+        self._start_target(name, config)
+
+    def _start_target(self, name, config):
+        # starting a running target again restarts it
+        session = sessions.find(self.window.id(), name)
+        if session:
+            self._stop_session(session)
+        start_time = perf_counter()
+        threading.Thread(target=debugger_thread, name='debugger_thread', args=(self.window, name, config, start_time)).start()
+
+    def _attach(self):
+        # processes of the machine the bridge runs on
+        bridge_url = None
+        for name, config in debug_targets(self.window):
+            if config.get('bridge', None):
+                bridge_url = config['bridge']
+                break
+
+        def pick():
+            try:
+                processes = list_processes(bridge_url)
+            except (OSError, subprocess.CalledProcessError, xmlrpc.client.Fault) as e:
+                sublime.status_message("LLDB: could not list processes: {}".format(e))
+                return
+            items = [[process['name'], "{}  {}".format(process['pid'], process['path'] or '')] for process in processes]
+
+            def on_done(index):
+                if index < 0:
+                    return
+                process = processes[index]
+                config = { "name": "{} ({})".format(process['name'], process['pid']), "attach": process['pid'], "executable": process['path'] }
+                if bridge_url:
+                    config['bridge'] = bridge_url
+                self._start_target(config['name'], config)
+            sublime.set_timeout(lambda: self.window.show_quick_panel(items, on_done), 0)
+        sublime.set_timeout_async(pick, 0)
+
+    def _connect(self):
+        targets = debug_targets(self.window)
+
+        def on_done(url):
+            config = { "name": url, "connect": url }
+            if targets:
+                # symbols come from the executable of the project
+                config['executable'] = targets[0][1].get('executable', None)
+            self._start_target(url, config)
+        self.window.show_input_panel("Remote debug server:", "connect://localhost:1234", on_done, None, None)
+
+    def _stop_debugger(self, stop_all=False):
+        active = sessions.active(self.window.id())
+        for session in sessions.for_window(self.window.id()):
+            if stop_all or session is active:
+                self._stop_session(session)
+
+    def _stop_session(self, session):
+        if len(session.bridge.sessions) <= 1 and not session.bridge.remote:
+            # no new session may join a bridge that is going down
+            session.bridge.closing = True
+        command_executor(self.window).submit(_stop_session, session)
+
+    def _run_action(self, lldb, action):
+        lldb_invalidate(self.window)
+        if action == 'continue':
+            debug_status[self.window.id()] = "running"
+            lldb.start()
+        elif action == 'pause':
+            lldb.pause()
+        elif action == 'step_into':
+            debug_status[self.window.id()] = "stepping"
+            lldb.step_into()
+        elif action == 'step_over':
+            debug_status[self.window.id()] = "stepping"
+            lldb.step_over()
+        elif action == 'step_out':
+            debug_status[self.window.id()] = "stepping"
+            lldb.step_out()
+        elif action == 'stop':
+            lldb.stop()
 
     def run(self, *args, **kwargs):
         if kwargs.get('start', False):
-            self._start_debugger()
+            self._start_debugger(kwargs.get('target', None))
+        if kwargs.get('attach', False):
+            self._attach()
+        if kwargs.get('connect', False):
+            self._connect()
         if kwargs.get('stop', False):
-            self._stop_debugger()
+            self._stop_debugger(kwargs.get('all', False))
 
         action = kwargs.get('action', 'nop')
-        with retry():
-            lldb = debuggers.get(self.window.id(), None)
-            if not lldb:
-                return
-            if action == 'nop':
-                return
-            elif action == 'continue':
-                debug_status[self.window.id()] = "running"
-                lldb.start()
-            elif action == 'pause':
-                lldb.pause()
-            elif action == 'step_into':
-                debug_status[self.window.id()] = "stepping"
-                lldb.step_into()
-            elif action == 'step_over':
-                debug_status[self.window.id()] = "stepping"
-                lldb.step_over()
-            elif action == 'step_out':
-                debug_status[self.window.id()] = "stepping"
-                lldb.step_out()
-            elif action == 'stop':
-                lldb.stop()
-
-        update_run_marker(self.window, lldb=lldb)
+        lldb = debuggers.get(self.window.id(), None)
+        if not lldb:
+            return
+        if action == 'nop':
+            return
+
+        # the bridge may be busy, do not wait for it on the UI thread. The
+        # run marker follows with the stop, which fetches the snapshot once
+        command_executor(self.window).submit(self._run_action, lldb, action)
 
     def is_enabled(self, *args, **kwargs):
         if not self.window.project_file_name():
             return False
 
-        if kwargs.get('start', False) and debuggers.get(self.window.id(), None) == None:
+        if kwargs.get('start', False) or kwargs.get('attach', False) or kwargs.get('connect', False):
             return True
 
         if kwargs.get('stop', False) and debuggers.get(self.window.id(), None) != None:
@@ -235,126 +1050,403 @@ class atdebug(sublime_plugin.WindowCommand):
         return False
 
 
+def rpc_timings(window):
+    # bridge calls of the running and the ended sessions of the window
+    timings = Timings()
+    if window.id() in ended_timings:
+        timings.merge(ended_timings[window.id()])
+    proxies = [session.lldb for session in sessions.for_window(window.id())]
+    proxies += [bridge.events for bridge in sessions.bridges(window.id()) if bridge.events]
+    for proxy in proxies:
+        timings.merge(proxy.timings)
+    return timings
+
+class atdebug_performance(sublime_plugin.WindowCommand):
+
+    def run(self, *args, **kwargs):
+        if kwargs.get('reset', False):
+            ended_timings.pop(self.window.id(), None)
+            for session in sessions.for_window(self.window.id()):
+                session.lldb.timings.clear()
+            for bridge in sessions.bridges(self.window.id()):
+                if bridge.events:
+                    bridge.events.timings.clear()
+            ui_timings.clear()
+            return
+
+        rpc = rpc_timings(self.window).summary()
+        ui = ui_timings.summary()
+        if kwargs.get('export', False):
+            # a scratch view to save or paste into a bug report
+            data = { "created": datetime.now().isoformat(), "unit": "seconds, bytes", "rpc": rpc, "ui": ui }
+            view = self.window.new_file()
+            view.set_scratch(True)
+            view.set_name('AnarchyDebug Performance.json')
+            view.set_syntax_file('Packages/JavaScript/JSON.sublime-syntax')
+            view.run_command('append', { "characters": json.dumps(data, indent=4, sort_keys=True) })
+            return
+
+        text = "AnarchyDebug: Performance ({})\n\n{}\n\n{}\n".format(
+            datetime.now().strftime('%H:%M:%S'), format_summary("Bridge calls", rpc), format_summary("UI", ui))
+        panel = self.window.create_output_panel('anarchydebug_performance')
+        panel.run_command('append', { "characters": text })
+        self.window.run_command('show_panel', { "panel": "output.anarchydebug_performance" })
+
+
+class atdebug_profile(sublime_plugin.WindowCommand):
+    """Sampling profiler, the bridge samples the stacks of all threads and folds them"""
+
+    def _start(self, session):
+        rate = settings.get('sampling_rate', 100)
+        try:
+            session.lldb.start_sampling(rate, settings.get('sampling_depth', 64))
+        except xmlrpc.client.Fault as e:
+            lldb_console_message(self.window, "could not start sampling: {}".format(e.faultString))
+            return
+        session.sampling = True
+        lldb_console_message(self.window, "sampling {} at {} Hz".format(session.name, rate))
+
+    def _stop(self, session):
+        session.sampling = False
+        try:
+            return Profile.from_bridge(session.lldb.stop_sampling())
+        except xmlrpc.client.Fault as e:
+            lldb_console_message(self.window, "could not stop sampling: {}".format(e.faultString))
+            return None
+
+    def _show(self, profile):
+        if not profile:
+            return
+        profiles[self.window.id()] = profile
+        view = self.window.new_file()
+        view.set_scratch(True)
+        view.set_name('AnarchyDebug Profile {}'.format(datetime.now().strftime('%H:%M:%S')))
+        view.run_command('append', { "characters": profile.format() })
+
+    def run(self, *args, **kwargs):
+        session = sessions.active(self.window.id())
+        if kwargs.get('start', False) and session:
+            command_executor(self.window).submit(self._start, session)
+        if kwargs.get('stop', False) and session:
+            command_executor(self.window).submit(self._stop, session, done=self._show)
+        if kwargs.get('export', False) and self.window.id() in profiles:
+            # to save and feed to flamegraph.pl or speedscope
+            view = self.window.new_file()
+            view.set_scratch(True)
+            view.set_name('AnarchyDebug Profile.folded')
+            view.run_command('append', { "characters": profiles[self.window.id()].collapsed() })
+
+    def is_enabled(self, *args, **kwargs):
+        session = sessions.active(self.window.id())
+        if kwargs.get('start', False):
+            return session is not None and not session.sampling
+        if kwargs.get('stop', False):
+            return session is not None and session.sampling
+        if kwargs.get('export', False):
+            return self.window.id() in profiles
+        return False
+
+
+class atdebug_watch(sublime_plugin.WindowCommand):
+    """Watch expressions, saved in the project and shown in the stack view"""
+
+    def _refresh(self):
+        status = debug_status.get(self.window.id(), None)
+        if self.window.id() not in debuggers or not is_stopped(status):
+            return
+        def refresh():
+            for callback in list(status_callbacks.get(self.window.id(), [])):
+                try:
+                    callback(self.window, status)
+                except Exception as e:
+                    print('Exception', e)
+        sublime.set_timeout_async(refresh, 0)
+
+    def _add(self, expression):
+        expression = expression.strip()
+        expressions = watch_expressions(self.window)
+        if expression and expression not in expressions:
+            set_watch_expressions(self.window, expressions + [expression])
+            self._refresh()
+
+    def _remove(self, index):
+        expressions = watch_expressions(self.window)
+        if 0 <= index < len(expressions):
+            set_watch_expressions(self.window, expressions[:index] + expressions[index + 1:])
+            self._refresh()
+
+    def run(self, *args, **kwargs):
+        if kwargs.get('add', False):
+            self.window.show_input_panel("Watch expression:", selected_expression(self.window), self._add, None, None)
+        if kwargs.get('remove', False):
+            self.window.show_quick_panel(watch_expressions(self.window), self._remove)
+
+    def is_enabled(self, *args, **kwargs):
+        if not self.window.project_file_name():
+            return False
+        if kwargs.get('remove', False):
+            return len(watch_expressions(self.window)) > 0
+        return True
+
+
+class atdebug_session(sublime_plugin.WindowCommand):
+
+    def run(self, *args, **kwargs):
+        window_sessions = sessions.for_window(self.window.id())
+        active = sessions.active(self.window.id())
+        items = []
+        for session in window_sessions:
+            if session is active:
+                items.append([session.name, "active, " + str(debug_status.get(self.window.id(), session.status))])
+            else:
+                items.append([session.name, str(session.status)])
+
+        def on_done(index):
+            if index >= 0:
+                activate_session(self.window, window_sessions[index])
+        self.window.show_quick_panel(items, on_done)
+
+    def is_enabled(self, *args, **kwargs):
+        return len(sessions.for_window(self.window.id())) > 1
+
+
 class atlldb(sublime_plugin.TextCommand):
 
-    @staticmethod
-    def save_breakpoints(window, lldb=None, breakpoints=None):
-        project_data = window.project_data()
-        if lldb:
-            with retry():
-                breakpoints = lldb.get_breakpoints()
-            for bp in breakpoints:
-                del bp['id']
-        if 'settings' not in project_data:
-            project_data['settings'] = {}
-        if 'SublimeAnarchyDebug' not in project_data['settings']:
-            project_data['settings']['SublimeAnarchyDebug'] = {}
-        project_data['settings']['SublimeAnarchyDebug']['breakpoints'] = breakpoints
-        window.set_project_data(project_data)
+    # fields lldb only takes when the breakpoint is created
+    set_fields = ('condition', 'ignore_count', 'log', 'counter', 'end_line')
 
     @staticmethod
     def load_breakpoints(window, lldb):
-        breakpoints = window.project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('breakpoints', [])
-        with retry():
-            lldb.delete_all_breakpoints()
+        atlldb.sync_breakpoints(window, lldb, [dict(bp) for bp in breakpoint_store(window).all()])
+
+    @staticmethod
+    def sync_breakpoints(window, lldb, breakpoints):
+        # make the breakpoints in lldb match the list, the bridge applies the
+        # difference and returns the resulting ids in list order. Used at
+        # session start and for every change while the session runs.
+        try:
+            ids = lldb.sync_breakpoints(breakpoints)
+        except xmlrpc.client.Fault:
+            ids = atlldb._apply_breakpoint_diff(window, lldb, breakpoints)
+
+        index = {}
+        for bp, bp_id in zip(breakpoints, ids):
+            index[(bp['file'], bp['line'])] = dict(bp, id=bp_id)
+        breakpoint_ids[lldb] = index
+
+    @staticmethod
+    def _set_call(bp):
+        # counters and logpoints are handled by the bridge, the target never stops
+        if bp.get('counter', False):
+            return ('set_counter', (bp['file'], bp['line'], bp.get('end_line', None), bp['condition'], bp['ignore_count']))
+        if bp.get('log', None):
+            return ('set_logpoint', (bp['file'], bp['line'], bp['log'], bp['condition'], bp['ignore_count']))
+        return ('set_breakpoint', (bp['file'], bp['line'], bp['condition'], bp['ignore_count']))
+
+    @staticmethod
+    def _set_failed(window, bp, fault):
+        kind = "counter" if bp.get('counter', False) else "logpoint" if bp.get('log', None) else "breakpoint"
+        lldb_console_message(window, "Could not set {} at {}:{}: {}".format(kind, bp['file'], bp['line'] + 1, fault.faultString))
+
+    @staticmethod
+    def _apply_breakpoint_diff(window, lldb, breakpoints):
+        index = breakpoint_ids.get(lldb, None)
+        if index is None:
+            try:
+                lldb.delete_all_breakpoints()
+            except xmlrpc.client.Fault as e:
+                print('Could not delete breakpoints', e)
+            index = {}
+
+        # two batches however many breakpoints there are, the bridge may be
+        # behind a slow link
+        wanted = set((bp['file'], bp['line']) for bp in breakpoints)
+        calls = []
+        for key, lldb_bp in index.items():
+            if key not in wanted and lldb_bp['id'] is not None:
+                calls.append(('delete_breakpoint', (lldb_bp['id'],)))
+
+        ids = []
+        created = []
         for bp in breakpoints:
-            with retry():
-                bp_id = lldb.set_breakpoint(bp['file'], bp['line'], bp['condition'], bp['ignore_count'])
-            if not bp['enabled']:
-                with retry():
-                    lldb.disable_breakpoint(bp_id)
-
-    def _disable_breakpoint(self, lldb, bp):
-        with retry():
-            breakpoints = lldb.get_breakpoints()
-        for lldb_bp in breakpoints:
-            if lldb_bp['file'] == bp['file'] and lldb_bp['line'] == bp['line']:
-                with retry():
-                    lldb.disable_breakpoint(lldb_bp['id'])
-        self.save_breakpoints(self.view.window(), lldb=lldb)
-
-    def _enable_breakpoint(self, lldb, bp):
-        with retry():
-            breakpoints = lldb.get_breakpoints()
-        for lldb_bp in breakpoints:
-            if lldb_bp['file'] == bp['file'] and lldb_bp['line'] == bp['line']:
-                with retry():
-                    lldb.enable_breakpoint(lldb_bp['id'])
-        self.save_breakpoints(self.view.window(), lldb=lldb)
-
-    def _create_breakpoint(self, lldb, file, line):
-        with retry():
-            lldb.set_breakpoint(file, line, None, 0)
-        self.save_breakpoints(self.view.window(), lldb=lldb)
-
-    def _remove_breakpoint(self, lldb, bp):
-        with retry():
-            breakpoints = lldb.get_breakpoints()
-        for lldb_bp in breakpoints:
-            if lldb_bp['file'] == bp['file'] and lldb_bp['line'] == bp['line']:
-                with retry():
-                    lldb.delete_breakpoint(lldb_bp['id'])
-        self.save_breakpoints(self.view.window(), lldb=lldb)
-
-    def toggle_breakpoint(self, lldb):
-        breakpoints = self.view.window().project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('breakpoints', [])
+            lldb_bp = index.get((bp['file'], bp['line']), None)
+            if lldb_bp and any(lldb_bp.get(field, None) != bp.get(field, None) for field in atlldb.set_fields):
+                if lldb_bp['id'] is not None:
+                    calls.append(('delete_breakpoint', (lldb_bp['id'],)))
+                lldb_bp = None
+            if not lldb_bp:
+                created.append(bp)
+                ids.append(None)
+            elif lldb_bp['id'] is None:
+                # refused last time and not edited since, lldb would refuse it again
+                ids.append(None)
+            else:
+                bp_id = lldb_bp['id']
+                if lldb_bp['enabled'] and not bp['enabled']:
+                    calls.append(('disable_breakpoint', (bp_id,)))
+                elif not lldb_bp['enabled'] and bp['enabled']:
+                    calls.append(('enable_breakpoint', (bp_id,)))
+                ids.append(bp_id)
+
+        # a breakpoint lldb does not take must not keep the others from being set
+        results = lldb.batch(calls + [atlldb._set_call(bp) for bp in created], errors=True)
+        for (name, args), result in zip(calls, results[:len(calls)]):
+            if isinstance(result, xmlrpc.client.Fault):
+                print('Could not', name.replace('_', ' '), args[0], result.faultString)
+        new_ids = []
+        for bp, result in zip(created, results[len(calls):]):
+            if isinstance(result, xmlrpc.client.Fault):
+                atlldb._set_failed(window, bp, result)
+                result = None
+            new_ids.append(result)
+        new_ids = iter(new_ids)
+        ids = [bp_id if bp_id is not None else next(new_ids) for bp_id in ids]
+        lldb.batch([('disable_breakpoint', (bp_id,)) for bp, bp_id in zip(breakpoints, ids) if bp in created and not bp['enabled'] and bp_id is not None], errors=True)
+        return ids
+
+    def _sync(self, lldbs):
+        # every change goes through the same diff, only what changed is sent
+        window = self.view.window()
+        breakpoints = [dict(bp) for bp in breakpoint_store(window).all()]
+        for lldb in lldbs:
+            command_executor(window).submit(atlldb.sync_breakpoints, window, lldb, breakpoints)
+
+    def toggle_breakpoint(self, lldbs):
+        store = breakpoint_store(self.view.window())
 
         cursor = self.view.sel()[0].begin()
         row, col = self.view.rowcol(cursor)
 
-        found = []
-        new_bps = []
-        for bp in breakpoints:
-            if bp['file'] == self.view.file_name() and bp['line'] == row:
-                if lldb:
-                    self._remove_breakpoint(lldb, bp)
-                found.append(bp)
-
-        if len(found) == 0:
-            breakpoints.append({
+        bp = store.remove(self.view.file_name(), row)
+        if not bp:
+            bp = {
                 "file": self.view.file_name(),
                 "line": row,
                 "enabled": True,
                 "condition": None,
                 "ignore_count": 0
-            })
-            if lldb:
-                self._create_breakpoint(lldb, self.view.file_name(), row)
-        else:
-            for bp in found:
-                breakpoints.remove(bp)
-        if not lldb:
-            self.save_breakpoints(self.view.window(), breakpoints=breakpoints)
-        update_markers(self.view)
+            }
+            store.add(bp)
+        self._sync(lldbs)
+        update_breakpoint_marker(self.view)
+        update_counter_marker(self.view)
 
-    def enable_disable_breakpoint(self, lldb):
-        breakpoints = self.view.window().project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('breakpoints', [])
+    def enable_disable_breakpoint(self, lldbs):
+        store = breakpoint_store(self.view.window())
 
         cursor = self.view.sel()[0].begin()
         row, col = self.view.rowcol(cursor)
 
-        found = False
-        for bp in breakpoints:
-            if bp['file'] == self.view.file_name() and bp['line'] == row and bp['enabled'] == True:
-                bp['enabled'] = False
-                if lldb:
-                    self._disable_breakpoint(lldb, bp)
-                found = True
-            elif bp['file'] == self.view.file_name() and bp['line'] == row and bp['enabled'] == False:
-                bp['enabled'] = True
-                if lldb:
-                    self._enable_breakpoint(lldb, bp)
-                found = True
-        if not lldb:
-            self.save_breakpoints(self.view.window(), breakpoints=breakpoints)
-        update_markers(self.view)
+        bp = store.get(self.view.file_name(), row)
+        if bp:
+            store.update(bp, enabled=not bp['enabled'])
+            self._sync(lldbs)
+        update_breakpoint_marker(self.view)
+
+    def _edit_breakpoint(self, lldbs, caption, field, parse, show=str, created=None):
+        # asks for a new value of one field, creates the breakpoint (with the
+        # fields in created) if there is none yet
+        window = self.view.window()
+        store = breakpoint_store(window)
+        file_name = self.view.file_name()
+        cursor = self.view.sel()[0].begin()
+        row, col = self.view.rowcol(cursor)
+
+        bp = store.get(file_name, row)
+        current = bp.get(field, None) if bp else None
+
+        def done(text):
+            try:
+                value = parse(text.strip())
+            except ValueError:
+                sublime.status_message("AnarchyDebug: invalid {} \"{}\"".format(field.replace('_', ' '), text))
+                return
+            bp = store.get(file_name, row)
+            if bp:
+                store.update(bp, **{ field: value })
+            else:
+                bp = {
+                    "file": file_name,
+                    "line": row,
+                    "enabled": True,
+                    "condition": None,
+                    "ignore_count": 0
+                }
+                bp.update(created or {})
+                bp[field] = value
+                store.add(bp)
+            self._sync(lldbs)
+            update_breakpoint_marker(self.view)
+
+        window.show_input_panel(caption, "" if current is None else show(current), done, None, None)
+
+    def edit_condition(self, lldbs):
+        self._edit_breakpoint(lldbs, "Breakpoint condition:", 'condition', lambda text: text or None)
+
+    def edit_ignore_count(self, lldbs):
+        def parse(text):
+            count = int(text or 0)
+            if count < 0:
+                raise ValueError(text)
+            return count
+        self._edit_breakpoint(lldbs, "Ignore breakpoint this many times:", 'ignore_count', parse)
+
+    def edit_log_message(self, lldbs):
+        # an empty message turns the logpoint back into a breakpoint
+        self._edit_breakpoint(lldbs, "Log message ({expression} is replaced by its value):", 'log', lambda text: text or None)
+
+    def toggle_counter(self, lldbs):
+        # a counter counts hits instead of stopping
+        window = self.view.window()
+        store = breakpoint_store(window)
+        cursor = self.view.sel()[0].begin()
+        row, col = self.view.rowcol(cursor)
+
+        bp = store.get(self.view.file_name(), row)
+        if bp:
+            store.update(bp, counter=not bp.get('counter', False))
+        else:
+            bp = {
+                "file": self.view.file_name(),
+                "line": row,
+                "enabled": True,
+                "condition": None,
+                "ignore_count": 0,
+                "counter": True
+            }
+            store.add(bp)
+        self._sync(lldbs)
+        update_breakpoint_marker(self.view)
+        update_counter_marker(self.view)
+
+    def edit_counter_end(self, lldbs):
+        # lines are 0 based in the project like breakpoint lines, 1 based in the input
+        def parse(text):
+            if not text:
+                return None
+            line = int(text)
+            if line < 1:
+                raise ValueError(text)
+            return line - 1
+        self._edit_breakpoint(lldbs, "Time from this line to line:", 'end_line', parse, show=lambda line: str(line + 1), created={ "counter": True })
 
     def run(self, *args, **kwargs):
-        lldb = debuggers.get(self.view.window().id(), None)
+        # breakpoints are set in all sessions of the window
+        lldbs = [session.lldb for session in sessions.for_window(self.view.window().id())]
         if kwargs.get('toggle_breakpoint', False):
-            self.toggle_breakpoint(lldb)
+            self.toggle_breakpoint(lldbs)
         if kwargs.get('enable_disable_breakpoint', False):
-            self.enable_disable_breakpoint(lldb)
+            self.enable_disable_breakpoint(lldbs)
+        if kwargs.get('edit_condition', False):
+            self.edit_condition(lldbs)
+        if kwargs.get('edit_ignore_count', False):
+            self.edit_ignore_count(lldbs)
+        if kwargs.get('edit_log_message', False):
+            self.edit_log_message(lldbs)
+        if kwargs.get('toggle_counter', False):
+            self.toggle_counter(lldbs)
+        if kwargs.get('edit_counter_end', False):
+            self.edit_counter_end(lldbs)
 
     def is_enabled(self, *args, **kwargs):
         if "source.swift" in self.view.scope_name(0) and self.view.window().project_file_name():
@@ -362,15 +1454,9 @@ class atlldb(sublime_plugin.TextCommand):
 
         # only show enable/disable when there is a breakpoint
         if kwargs.get('enable_disable_breakpoint', False):
-            breakpoints = self.view.window().project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('breakpoints', [])
             cursor = self.view.sel()[0].begin()
             row, col = self.view.rowcol(cursor)
-
-            new_bps = []
-            for bp in breakpoints:
-                if bp['file'] == self.view.file_name() and bp['line'] == row:
-                    return True
-            return False
+            return breakpoint_store(self.view.window()).get(self.view.file_name(), row) is not None
 
         return True
 
@@ -387,62 +1473,104 @@ class LLDBBreakPointHighlighter(sublime_plugin.EventListener):
         update_markers(view)
 
 def update_breakpoint_marker(view):
-    breakpoints = view.window().project_data().get('settings', {}).get('SublimeAnarchyDebug', {}).get('breakpoints', [])
     enabled_markers = []
     disabled_markers = []
-    for bp in breakpoints:
-        if bp['file'] == view.file_name():
-            location = view.line(view.text_point(bp['line'], 0))
-            if bp['enabled']:
-                enabled_markers.append(location)
-            else:
-                disabled_markers.append(location)
+    log_markers = []
+    counter_markers = []
+    for bp in breakpoint_store(view.window()).for_file(view.file_name()).values():
+        location = view.line(view.text_point(bp['line'], 0))
+        if not bp['enabled']:
+            disabled_markers.append(location)
+        elif bp.get('counter', False):
+            counter_markers.append(location)
+        elif bp.get('log', None):
+            log_markers.append(location)
+        else:
+            enabled_markers.append(location)
     view.add_regions("breakpoint_enabled", enabled_markers, "breakpoint_enabled", "Packages/SublimeAnarchyDebug/images/breakpoint_enabled.png", sublime.HIDDEN)
     view.add_regions("breakpoint_disabled", disabled_markers, "breakpoint_disabled", "Packages/SublimeAnarchyDebug/images/breakpoint_disabled.png", sublime.HIDDEN)
+    view.add_regions("breakpoint_log", log_markers, "breakpoint_log", "Packages/SublimeAnarchyDebug/images/logpoint.png", sublime.HIDDEN)
+    view.add_regions("breakpoint_counter", counter_markers, "breakpoint_counter", "Packages/SublimeAnarchyDebug/images/counter.png", sublime.HIDDEN)
+
+def update_counter_marker(view):
+    # hits per second and average times as inline annotations at the end of the line
+    stats = counter_stats.get(view.window().id(), {})
+    phantoms = []
+    for bp in breakpoint_store(view.window()).for_file(view.file_name()).values():
+        stat = stats.get((bp['file'], bp['line']), None)
+        if not stat or not bp.get('counter', False):
+            continue
+        text = format_counter(stat, bp.get('end_line', None))
+        point = view.line(view.text_point(bp['line'], 0)).end()
+        phantoms.append(sublime.Phantom(
+            sublime.Region(point), '<span class="lldb-counter">&nbsp;&nbsp;{}</span>'.format(html.escape(text)), sublime.LAYOUT_INLINE
+        ))
+    phantom_set = counter_phantoms.get(view.id(), None)
+    if not phantom_set:
+        if not phantoms:
+            return
+        phantom_set = sublime.PhantomSet(view, "lldb_counters")
+        counter_phantoms[view.id()] = phantom_set
+    phantom_set.update(phantoms)
+    if not phantoms:
+        del counter_phantoms[view.id()]
 
-def update_run_marker(window, lldb=None):
+def update_counter_markers(window):
+    for view in window.views():
+        if view.file_name():
+            update_counter_marker(view)
+
+@timed('update_run_marker')
+def update_run_marker(window, lldb=None, snapshot=None):
     if not lldb:
         for view in window.views():
             view.erase_regions("run_pointer")
         return
 
-    with retry():
-        try:
-            bt = lldb.get_backtrace_for_selected_thread()
-            if 'bt' not in bt:
-                for view in window.views():
-                    view.erase_regions("run_pointer")
-                return
-            for frame in bt['bt']:
-                if 'file' in frame and frame['line'] != 0:
-                    found = False
-                    for view in window.views():
-                        if view.file_name() == frame['file']:
-                            location = view.line(view.text_point(frame['line'] - 1, 0))
-                            view.add_regions("run_pointer", [location], "entity.name.class", "Packages/SublimeAnarchyDebug/images/stop_point.png", sublime.DRAW_NO_FILL)
-                            if not view.visible_region().contains(location):
-                                view.show_at_center(location)
-                            if window.active_group() == 0:
-                                window.focus_view(view)
-                            found = True
-                    if not found:
-                        grp = window.active_group()
-                        window.focus_group(0)
-                        view = window.open_file(frame['file'] + ":" + str(frame['line']), sublime.ENCODED_POSITION)
-                        window.focus_group(grp)
-                        location = view.line(view.text_point(frame['line'] - 1, 0))
-                        view.add_regions("run_pointer", [location], "entity.name.class", "Packages/SublimeAnarchyDebug/images/stop_point.png", sublime.DRAW_NO_FILL)
-                        if not view.visible_region().contains(location):
-                            view.show_at_center(location)
-                    break
-        except xmlrpc.client.Fault:
+    try:
+        if snapshot is None:
+            snapshot = lldb_snapshot(window)
+        frame = snapshot['location']
+        if not frame:
             for view in window.views():
                 view.erase_regions("run_pointer")
+            return
+        found = False
+        for view in window.views():
+            if view.file_name() == frame['file']:
+                location = view.line(view.text_point(frame['line'] - 1, 0))
+                view.add_regions("run_pointer", [location], "entity.name.class", "Packages/SublimeAnarchyDebug/images/stop_point.png", sublime.DRAW_NO_FILL)
+                if not view.visible_region().contains(location):
+                    view.show_at_center(location)
+                if window.active_group() == 0:
+                    window.focus_view(view)
+                found = True
+        if not found:
+            grp = window.active_group()
+            window.focus_group(0)
+            view = window.open_file(frame['file'] + ":" + str(frame['line']), sublime.ENCODED_POSITION)
+            window.focus_group(grp)
+            location = view.line(view.text_point(frame['line'] - 1, 0))
+            view.add_regions("run_pointer", [location], "entity.name.class", "Packages/SublimeAnarchyDebug/images/stop_point.png", sublime.DRAW_NO_FILL)
+            if not view.visible_region().contains(location):
+                view.show_at_center(location)
+    except xmlrpc.client.Fault:
+        for view in window.views():
+            view.erase_regions("run_pointer")
 
 def update_markers(view):
     update_breakpoint_marker(view)
+    update_counter_marker(view)
 
-    lldb = debuggers.get(view.window().id(), None)
-    update_run_marker(view.window(), lldb=lldb)
-    if lldb:
-        lldb_update_status(view.window())
+    window = view.window()
+    lldb = debuggers.get(window.id(), None)
+    if not lldb:
+        update_run_marker(window)
+        return
+
+    # may have to ask the bridge, keep that off the UI thread
+    def update():
+        update_run_marker(window, lldb=lldb)
+        if window.id() in debuggers:
+            lldb_update_status(window)
+    sublime.set_timeout_async(update, 0)
@@ -0,0 +1,58 @@
+import sublime
+
+import threading
+from queue import Queue
+
+executors = {} # key = window.id, value CommandExecutor
+
+
+class CommandExecutor(object):
+    """Runs bridge calls of UI commands on a worker thread, one at a time
+
+    Commands are executed in the order they were submitted, so rapid step
+    commands queue up behind each other instead of blocking the UI thread
+    while the bridge is busy. `done` callbacks get the result on the UI
+    thread.
+    """
+
+    def __init__(self, name):
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, func, *args, done=None):
+        self.queue.put((func, args, done))
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def shutdown(self):
+        self.queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            func, args, done = item
+            try:
+                result = func(*args)
+            except Exception as e:
+                print('Exception', e)
+                continue
+            if done:
+                sublime.set_timeout(lambda done=done, result=result: done(result), 0)
+
+
+def command_executor(window):
+    executor = executors.get(window.id(), None)
+    if not executor:
+        executor = CommandExecutor('command_executor_{}'.format(window.id()))
+        executors[window.id()] = executor
+    return executor
+
+def shutdown_executor(window):
+    executor = executors.pop(window.id(), None)
+    if executor:
+        executor.shutdown()
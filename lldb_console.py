@@ -2,11 +2,56 @@ import sublime_plugin
 import sublime
 
 import os
+import re
 
-from .debug import debuggers, status_callbacks, output_callbacks, retry, debug_status
+from .debug import debuggers, status_callbacks, output_callbacks, debug_status, is_stopped, lldb_snapshot, lldb_expand_thread, lldb_load_children, lldb_invalidate, lldb_update_status, lldb_watches
+from .executor import command_executor
+from .lldb_format import StackFormatter, block_changes
+from .perf import timed
 
 window_layouts = {}
+thread_blocks = {} # key = window.id, value dict thread id -> (thread info, formatted text, toplevel frame)
+stack_blocks = {} # key = view.id, value list of [key, text] currently shown in the stack view
+expanded_variables = {} # key = window.id, value set of variable paths (tuple of names) expanded in the stack view
+locals_rows = {} # key = window.id, value list of (kind, path, node) per line of the locals block
+formatters = {} # key = window.id, value StackFormatter
+
+def stack_formatter(window):
+    project_dir = os.path.dirname(window.project_file_name())
+    formatter = formatters.get(window.id(), None)
+    if not formatter or formatter.project_dir != project_dir:
+        formatter = StackFormatter(project_dir)
+        formatters[window.id()] = formatter
+    return formatter
+
+def toggle_variable(view, point):
+    window = view.window()
+    start = 0
+    for key, text in stack_blocks.get(view.id(), []):
+        if key == "locals":
+            break
+        start += len(text)
+    else:
+        return
 
+    rows = locals_rows.get(window.id(), [])
+    row = view.rowcol(point)[0] - view.rowcol(start)[0]
+    if row < 0 or row >= len(rows) or rows[row] is None:
+        return
+
+    kind, path, node = rows[row]
+    expanded = expanded_variables.setdefault(window.id(), set())
+    if kind == "more":
+        lldb_load_children(window, node)
+    elif node['children'] > 0 and path in expanded:
+        expanded.discard(path)
+    elif node['children'] > 0:
+        expanded.add(path)
+    else:
+        return
+    update_stack(window, debug_status.get(window.id(), None))
+
+@timed('update_stack')
 def update_stack(window, status):
     if window.id() not in debuggers:
         return
@@ -23,88 +68,52 @@ def update_stack(window, status):
     if not view:
         return
 
+    if not is_stopped(status):
+        return
+
+    snapshot = lldb_snapshot(window)
+    bt = snapshot['threads']
 
-    with retry():
-        bt = lldb.get_backtrace()
+    # runs on the debugger or async thread, never on the UI thread.
+    # threads that did not change since the last stop keep their text
+    formatter = stack_formatter(window)
+    previous = thread_blocks.get(window.id(), {})
+    formatted = {}
 
     threads = []
     var_dump = ""
     for thread_id, info in bt.items():
-        buf = ""
-
-        frames = info['bt']
-        buf += "* Thread {} ({}, queue: {}, id: {})\n".format(info['index'], info['name'], info['queue'], info['id'])
-        delim_len = (len(buf) - 1)
-        buf += "-" * delim_len + "\n"
-
-        max_len = 0
-        for frame in frames:
-            if frame['module'] is not None and len(frame['module']) > max_len:
-                max_len = len(frame['module'])
-
-        frame_id = 0
-        toplevel = -1
-        for frame in frames:
-            if 'function' in frame:
-                if toplevel < 0:
-                    toplevel = frame_id
-                f = os.path.relpath(frame['file'], start=os.path.dirname(window.project_file_name()))
-                buf += '{num: <3} {mod: <{max_len}} {addr:#016x} {file}:{line}'.format(
-                    num=frame_id,
-                    addr=int(frame['address']),  # number to big for rpc so this comes as a string -.-
-                    mod=frame['module'],
-                    file=f,
-                    line=frame['line'],
-                    max_len = max_len
-                )
-                if frame['column'] > 0:
-                    buf += ":{col}".format(col=frame['column'])
-                buf += " ({func})".format(func='%s [inlined]' % frame['function'] if frame['inlined'] else frame['function'])
-            else:
-                buf += '{num: <3} {mod: <{max_len}} {addr:#016x} {symbol} + {offset}'.format(
-                    num=frame_id,
-                    addr=int(frame['address']),  # number to big for rpc so this comes as a string -.-
-                    mod=frame['module'],
-                    symbol=frame['symbol'],
-                    offset=int(frame['offset']),  # number to big for rpc so this comes as a string -.-
-                    max_len=max_len
-                )
-            buf += "\n"
-            frame_id += 1
-
-        buf += "-" * delim_len + "\n"
-        buf += "Status: {}".format(info['stop_reason'])
-        buf += "\n"
+        cached = previous.get(thread_id, None)
+        if cached and cached[0] == info:
+            buf, toplevel = cached[1], cached[2]
+        else:
+            buf, toplevel = formatter.format_thread(info)
+        formatted[thread_id] = (info, buf, toplevel)
 
         if info['selected']:
-            with retry():
-                var = lldb.get_local_variables(info['id'], toplevel)
-            var_dump = "* Local variables for frame #{}\n".format(toplevel)
-            var_dump += "-" * (len(var_dump) - 1) + "\n"
-            max_len_var = 0
-            for name, value in var.items():
-                if len(name) > max_len_var:
-                    max_len_var = len(name)
-            items = var.items()
-            items = sorted(items, key=lambda item: item[0])
-            for name, value in items:
-                var_dump += "{name: >{max_len}} -> {value}\n".format(
-                    name=name,
-                    value=value,
-                    max_len=max_len_var
-                )
-            var_dump += "\n"
-            threads.insert(0, buf)
+            var = []
+            if snapshot['locals'] and snapshot['locals']['thread'] == info['id']:
+                var = snapshot['locals']['variables']
+            var_dump, locals_rows[window.id()] = formatter.format_locals(
+                toplevel, var,
+                expanded_variables.get(window.id(), set()),
+                lambda node: lldb_load_children(window, node)
+            )
+            threads.insert(0, (thread_id, buf))
         else:
-            threads.append(buf)
-
-    buttons = "[ continue ]   [ pause ]   [ step into ]   [ step over ]   [ step out ]   [ stop ]\n\n"
-    if len(threads) > 1:
-        data = buttons + threads[0] + "\n" + var_dump + "\n".join(threads[1:])
-    else:
-        data = buttons + threads[0] + "\n" + var_dump
-    view.run_command("update_lldb_stack", { "data": data })
-
+            threads.append((thread_id, buf))
+    thread_blocks[window.id()] = formatted
+
+    watch_dump = None
+    changed = []
+    watches = lldb_watches(window)
+    if watches:
+        watch_dump, watch_changed = formatter.format_watches(watches)
+        changed = [["watches", row] for row in watch_changed]
+    blocks = formatter.format_blocks(threads, var_dump, watch_dump)
+    view.run_command("update_lldb_stack", { "blocks": blocks, "changed": changed })
+
+@timed('update_console')
 def update_console(window, buf):
     view = None
     for v in window.views():
@@ -120,6 +129,7 @@ def update_console(window, buf):
 
 class updateLldbConsole(sublime_plugin.TextCommand):
 
+    @timed('update_lldb_console')
     def run(self, edit, **kwargs):
         data = kwargs.get("data", "")
         last_line = self.view.line(self.view.size())
@@ -135,6 +145,11 @@ class updateLldbConsole(sublime_plugin.TextCommand):
                 self.view.insert(edit, self.view.size(), "(lldb) ")
 
 
+        max_lines = sublime.load_settings('SublimeAnarchyDebug.sublime-settings').get('console_max_lines', 10000)
+        lines = self.view.rowcol(self.view.size())[0]
+        if max_lines and lines > max_lines:
+            self.view.erase(edit, sublime.Region(0, self.view.text_point(lines - max_lines, 0)))
+
         self.view.sel().clear()
         self.view.sel().add(sublime.Region(self.view.size(), self.view.size()))
         self.view.show(self.view.size(), False)
@@ -144,12 +159,31 @@ class updateLldbConsole(sublime_plugin.TextCommand):
 
 class updateLldbStack(sublime_plugin.TextCommand):
 
+    @timed('update_lldb_stack')
     def run(self, edit, **kwargs):
-        data = kwargs.get("data", "")
-        region = sublime.Region(0, self.view.size())
-        self.view.replace(edit, region, data)
+        blocks = kwargs.get("blocks", [])
+        changes = block_changes(stack_blocks.get(self.view.id(), None), blocks, self.view.size())
+        if changes is None:
+            region = sublime.Region(0, self.view.size())
+            self.view.replace(edit, region, "".join(text for key, text in blocks))
+        else:
+            # only the blocks that changed
+            for start, end, text in changes:
+                self.view.replace(edit, sublime.Region(start, end), text)
+        stack_blocks[self.view.id()] = blocks
+
+        # changed values as [block key, line in the block]
+        starts = {}
+        start = 0
+        for key, text in blocks:
+            starts[key] = start
+            start += len(text)
+        regions = []
+        for key, row in kwargs.get("changed", []):
+            if key in starts:
+                regions.append(self.view.line(self.view.text_point(self.view.rowcol(starts[key])[0] + row, 0)))
+        self.view.add_regions("lldb_changed", regions, "markup.changed", "", 0)
         self.view.sel().clear()
-        self.view.set_syntax_file('Packages/SublimeAnarchyDebug/lldb_stack.sublime-syntax')
 
     def is_visible(self):
         return False
@@ -197,6 +231,7 @@ class atdebugConsole(sublime_plugin.WindowCommand):
     def _hide_console(self):
         for view in self.window.views():
             if view.name() in ["LLDB Console", "LLDB Stack"]:
+                stack_blocks.pop(view.id(), None)
                 self.window.focus_view(view)
                 self.window.run_command("close_file")
         self.window.set_layout(window_layouts[self.window.id()])
@@ -226,6 +261,8 @@ class atdebugConsole(sublime_plugin.WindowCommand):
 
 class LldbConsoleWatcher(sublime_plugin.EventListener):
 
+    running = set() # ids of console views with a command in the executor queue
+
     def enable(self, view):
         if not view: return False
         if "lldb.console" not in view.scope_name(0): return False
@@ -252,19 +289,38 @@ class LldbConsoleWatcher(sublime_plugin.EventListener):
         if line == "":
             last_line = view.line(view.size() - 1)
             line = view.substr(last_line)
-            if line.startswith('(lldb) '):
+            if line.startswith('(lldb) ') and view.id() not in self.running:
                 command = line[7:]
-                with retry():
-                    result = lldb.execute_lldb_command(command)
-                debug_status[view.window().id()] = "command"
-                if result['succeeded']:
-                    lines = result['output'].split('\n')
-                    buf = "\n".join(["LLDB OK: " + l for l in lines if len(l) > 0])
-                    view.run_command("update_lldb_console", { "data": buf })
-                else:
-                    lines = result['error'].split('\n')
-                    buf = "\n".join(["LLDB ERR: " + l for l in lines if len(l) > 0])
-                    view.run_command("update_lldb_console", { "data": buf })
+                # queued behind step commands that are still running
+                self.running.add(view.id())
+                command_executor(view.window()).submit(
+                    self.execute, view.window(), lldb, command,
+                    done=lambda result: self.show_result(view, result)
+                )
+
+    def execute(self, window, lldb, command):
+        lldb_invalidate(window)
+        try:
+            result = lldb.execute_lldb_command(command)
+        except Exception as e:
+            return { "succeeded": False, "error": str(e) }
+        debug_status[window.id()] = "command"
+        # the command may have selected another frame or moved the target, no
+        # event tells, so ask the bridge instead of waiting for the next stop
+        if window.id() in debuggers:
+            lldb_update_status(window)
+        return result
+
+    def show_result(self, view, result):
+        self.running.discard(view.id())
+        if result['succeeded']:
+            lines = result['output'].split('\n')
+            buf = "\n".join(["LLDB OK: " + l for l in lines if len(l) > 0])
+            view.run_command("update_lldb_console", { "data": buf })
+        else:
+            lines = result['error'].split('\n')
+            buf = "\n".join(["LLDB ERR: " + l for l in lines if len(l) > 0])
+            view.run_command("update_lldb_console", { "data": buf })
 
 class LldbStackWatcher(sublime_plugin.EventListener):
 
@@ -304,6 +360,14 @@ class LldbStackWatcher(sublime_plugin.EventListener):
             view.window().run_command('atdebug', { 'action' : 'step_out' })
         elif 'btn_stop' in scope:
             view.window().run_command('atdebug', { 'action' : 'stop' })
+        elif 'btn_more_frames' in scope:
+            header = view.substr(sublime.Region(0, view.sel()[0].begin())).rfind('* Thread')
+            match = re.match(r'\* Thread .*, id: ([0-9]+)\)', view.substr(view.line(header)))
+            if match:
+                lldb_expand_thread(view.window(), int(match.group(1)))
+                update_stack(view.window(), debug_status.get(view.window().id(), None))
+        elif 'locals' in scope:
+            toggle_variable(view, view.sel()[0].begin())
 
         view.sel().clear()
         view.sel().add(view.text_point(1,0))
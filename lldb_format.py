@@ -0,0 +1,189 @@
+import os
+
+BUTTONS = "[ continue ]   [ pause ]   [ step into ]   [ step over ]   [ step out ]   [ stop ]\n\n"
+
+class StackFormatter(object):
+    """Text of the LLDB Stack view
+
+    One instance per project directory, paths of source files are made
+    relative to it once and remembered.
+    """
+
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.relpaths = {}
+
+    def relpath(self, file):
+        path = self.relpaths.get(file, None)
+        if path is None:
+            path = os.path.relpath(file, start=self.project_dir)
+            self.relpaths[file] = path
+        return path
+
+    def format_thread(self, info):
+        """Returns the text of a thread block and the index of its first frame with a function"""
+        frames = info['bt']
+        header = "* Thread {} ({}, queue: {}, id: {})".format(info['index'], info['name'], info['queue'], info['id'])
+        delimiter = "-" * len(header)
+        lines = [header, delimiter]
+
+        max_len = 0
+        for frame in frames:
+            if frame['module'] is not None and len(frame['module']) > max_len:
+                max_len = len(frame['module'])
+
+        # the column width is the same for all frames, so put it into the format once
+        source_format = '{{num: <3}} {{mod: <{width}}} {{addr:#016x}} {{file}}:{{line}}'.format(width=max_len)
+        symbol_format = '{{num: <3}} {{mod: <{width}}} {{addr:#016x}} {{symbol}} + {{offset}}'.format(width=max_len)
+
+        toplevel = -1
+        for frame_id, frame in enumerate(frames):
+            if 'function' in frame:
+                if toplevel < 0:
+                    toplevel = frame_id
+                line = source_format.format(
+                    num=frame_id,
+                    addr=int(frame['address']),  # number to big for rpc so this comes as a string -.-
+                    mod=frame['module'],
+                    file=self.relpath(frame['file']),
+                    line=frame['line']
+                )
+                if frame['column'] > 0:
+                    line += ":{col}".format(col=frame['column'])
+                line += " ({func})".format(func='%s [inlined]' % frame['function'] if frame['inlined'] else frame['function'])
+            else:
+                line = symbol_format.format(
+                    num=frame_id,
+                    addr=int(frame['address']),  # number to big for rpc so this comes as a string -.-
+                    mod=frame['module'],
+                    symbol=frame['symbol'],
+                    offset=int(frame['offset'])  # number to big for rpc so this comes as a string -.-
+                )
+            lines.append(line)
+
+        if info.get('frame_count', len(frames)) > len(frames):
+            lines.append("    [ {} more frames ]".format(info['frame_count'] - len(frames)))
+        lines.append(delimiter)
+        lines.append("Status: {}".format(info['stop_reason']))
+        lines.append("")
+        return "\n".join(lines), toplevel
+
+    def format_locals(self, toplevel, variables, expanded, load_children):
+        """Returns the text of the locals block and what is shown on every line of it
+
+        `expanded` is the set of variable paths (tuples of names) to show
+        the children of, `load_children(node)` fetches the next page of
+        children into node['loaded'].
+        """
+        var_dump = "* Local variables for frame #{}\n".format(toplevel)
+        var_dump += "-" * (len(var_dump) - 1) + "\n"
+        lines = [var_dump]
+        rows = [None, None]
+
+        max_len_var = 0
+        for node in variables:
+            name_len = len(node['name']) + (4 if node['children'] > 0 else 0)
+            if name_len > max_len_var:
+                max_len_var = name_len
+
+        def add(nodes, path, depth):
+            line_format = "{{name: >{width}}} -> {{value}}\n".format(width=max_len_var + 2 * depth)
+            for node in nodes:
+                node_path = path + (node['name'],)
+                marker = ""
+                if node['children'] > 0:
+                    marker = "[-] " if node_path in expanded else "[+] "
+                lines.append(line_format.format(name=marker + node['name'], value=node['value']))
+                rows.append(("node", node_path, node))
+                if node['children'] > 0 and node_path in expanded:
+                    if 'loaded' not in node:
+                        load_children(node)
+                    loaded = node.get('loaded', [])
+                    add(loaded, node_path, depth + 1)
+                    if len(loaded) < node['children']:
+                        # lined up with the arrows of the children
+                        lines.append(" " * (max_len_var + 2 * depth + 3) + "[ {} more ]\n".format(node['children'] - len(loaded)))
+                        rows.append(("more", node_path, node))
+
+        add(variables, (), 0)
+        lines.append("\n")
+        rows.append(None)
+        return "".join(lines), rows
+
+    def format_watches(self, watches):
+        """Returns the text of the watch expressions block and the lines of it with changed values"""
+        header = "* Watch expressions\n"
+        lines = [header, "-" * (len(header) - 1) + "\n"]
+        changed = []
+
+        width = max(len(watch['expression']) for watch in watches)
+        for watch in watches:
+            if watch['error'] is not None:
+                value = "<{}>".format(watch['error'].strip().split("\n")[0])
+            else:
+                value = " ".join(watch['value'].split("\n"))
+            if watch['changed']:
+                changed.append(len(lines))
+            lines.append("{expression: >{width}} -> {value}\n".format(expression=watch['expression'], width=width, value=value))
+        lines.append("\n")
+        return "".join(lines), changed
+
+    def format_blocks(self, threads, var_dump, watch_dump=None):
+        """Returns the stack view as a list of [key, text] blocks
+
+        `threads` is a list of (thread id, text), the selected thread first,
+        its locals follow it. Keys stay the same from stop to stop, so the
+        view only replaces the blocks whose text changed.
+        """
+        blocks = [["buttons", BUTTONS]]
+        if watch_dump is not None:
+            blocks.append(["watches", watch_dump])
+        for i, (thread_id, buf) in enumerate(threads):
+            if i == 0:
+                blocks.append(["thread " + str(thread_id), buf + "\n"])
+                blocks.append(["locals", var_dump])
+            elif i < len(threads) - 1:
+                blocks.append(["thread " + str(thread_id), buf + "\n"])
+            else:
+                blocks.append(["thread " + str(thread_id), buf])
+        return blocks
+
+
+def block_changes(previous, blocks, size):
+    """Replacements that turn the `previous` blocks into `blocks`
+
+    Returns (start, end, text) for every block whose text changed, back to
+    front so the offsets of the blocks before stay valid, or None if the
+    whole text has to be replaced because the keys differ or the view does
+    not hold `previous` (`size` is the length of its text).
+    """
+    if previous is None or [key for key, text in previous] != [key for key, text in blocks] \
+            or sum(len(text) for key, text in previous) != size:
+        return None
+    changes = []
+    end = size
+    for (old_key, old_text), (key, text) in reversed(list(zip(previous, blocks))):
+        start = end - len(old_text)
+        if old_text != text:
+            changes.append((start, end, text))
+        end = start
+    return changes
+
+
+def format_counter(stat, end_line=None):
+    """Annotation of a counting breakpoint: hits, hits per second and the
+    average time to `end_line` (0 based) if it times a range"""
+    parts = ["{} hits".format(stat['hits']), "{:.0f}/s".format(stat['rate'])]
+    if end_line is not None:
+        if stat['paired']:
+            average = stat['paired_time'] / stat['paired']
+            if average < 0.001:
+                duration = "{:.1f} µs".format(average * 1000000)
+            elif average < 1:
+                duration = "{:.2f} ms".format(average * 1000)
+            else:
+                duration = "{:.2f} s".format(average)
+            parts.append("avg {} to line {}".format(duration, end_line + 1))
+        else:
+            parts.append("line {} not reached".format(end_line + 1))
+    return ", ".join(parts)
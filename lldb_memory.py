@@ -0,0 +1,242 @@
+import sublime_plugin
+import sublime
+
+import re
+import xmlrpc.client
+
+from .debug import debuggers, status_callbacks, debug_status, is_stopped, stop_cache, lldb_evaluate, lldb_console_message, selected_expression
+from .executor import command_executor
+from .memory import MemoryPages, format_memory
+from .perf import timed
+
+memory_views = {} # key = view.id, value { "address": first address, "size": bytes the view spans, "layout": (address, size) in the buffer, "stopped": bool, "generation": stop number, "rendered": set of rendered blocks }
+
+ROW_SIZE = 16
+PAGE_SIZE = 4096
+HEADER_LINES = 2
+BUTTONS = "[ previous ]   [ next ]   [ go to ]"
+BLOCK_ROWS = 64 # rows that are rendered together
+SCROLL_INTERVAL = 100 # ms between looks at the viewport, there is no scroll event
+
+def memory_pages(window):
+    # the page cache lives in the stop cache, resuming the target drops it
+    lldb = debuggers[window.id()]
+
+    def read(address, size):
+        try:
+            # XML-RPC integers are 32 bit
+            return lldb.read_memory(str(address), size).data
+        except xmlrpc.client.Fault as e:
+            if 'is not supported' in e.faultString:
+                raise
+            return None
+    cache_size = sublime.load_settings('SublimeAnarchyDebug.sublime-settings').get('memory_cache_size', 4194304)
+    return stop_cache(window).get(('memory',), lambda: MemoryPages(read, PAGE_SIZE, max(1, cache_size // PAGE_SIZE)))
+
+def memory_view(window):
+    for view in window.views():
+        if view.name() == "LLDB Memory":
+            return view
+    return None
+
+def memory_layout(address, size):
+    # a line per row with only the address, rows get their bytes when scrolled into view
+    return "".join("0x{:016x}\n".format(row) for row in range(address, address + size, ROW_SIZE))
+
+def resolve_address(window, text):
+    # a number or an expression with a pointer value
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    result = lldb_evaluate(window, [text])[0]
+    if result['error'] is not None:
+        raise ValueError(result['error'])
+    match = re.search(r'0x[0-9a-fA-F]+', result['value'])
+    if match:
+        return int(match.group(0), 16)
+    return int(result['value'], 0)
+
+@timed('update_memory')
+def update_memory(window, status, top=False):
+    # the address lines stay in the buffer while address and size are the
+    # same, a new stop only renders the blocks in the viewport again
+    view = memory_view(window)
+    if not view or view.id() not in memory_views or window.id() not in debuggers:
+        return
+    state = memory_views[view.id()]
+    state['generation'] += 1
+    state['rendered'] = set()
+    state['stopped'] = is_stopped(status)
+    if not state['stopped']:
+        # rows keep the memory of the last stop until the next one
+        view.run_command("update_lldb_memory", { "status": "({}, memory is read at the next stop)".format(status or "not running"), "top": top })
+        return
+
+    size = sublime.load_settings('SublimeAnarchyDebug.sublime-settings').get('memory_view_size', 4096)
+    state['size'] = max(ROW_SIZE, size - size % ROW_SIZE)
+    if state['layout'] != (state['address'], state['size']):
+        state['layout'] = (state['address'], state['size'])
+        view.run_command("update_lldb_memory", { "text": BUTTONS + "\n\n" + memory_layout(state['address'], state['size']), "top": top })
+    else:
+        view.run_command("update_lldb_memory", { "status": "", "top": top })
+    sublime.set_timeout(lambda: render_visible(window, view), 0)
+
+def render_visible(window, view):
+    # blocks of rows in the viewport that still show only their address
+    state = memory_views.get(view.id(), None)
+    if not state or not state['stopped'] or state['layout'] is None:
+        return
+    visible = view.visible_region()
+    first = max(0, view.rowcol(visible.begin())[0] - HEADER_LINES)
+    last = min(state['size'] // ROW_SIZE - 1, view.rowcol(visible.end())[0] - HEADER_LINES)
+    if last < first:
+        return
+    blocks = [block for block in range(first // BLOCK_ROWS, last // BLOCK_ROWS + 1) if block not in state['rendered']]
+    if not blocks:
+        return
+    state['rendered'].update(blocks)
+    generation = state['generation']
+    sublime.set_timeout_async(lambda: render_blocks(window, view, generation, blocks), 0)
+
+def render_blocks(window, view, generation, blocks):
+    state = memory_views.get(view.id(), None)
+    if not state or state['generation'] != generation or window.id() not in debuggers:
+        return
+    block_size = BLOCK_ROWS * ROW_SIZE
+    end_of_view = state['address'] + state['size']
+    start = state['address'] + blocks[0] * block_size
+    end = min(end_of_view, state['address'] + (blocks[-1] + 1) * block_size)
+    pages = memory_pages(window)
+    try:
+        # the whole viewport in one read
+        pages.load(start, end - start)
+        for block in blocks:
+            address = state['address'] + block * block_size
+            size = min(block_size, end_of_view - address)
+            view.run_command("update_lldb_memory", {
+                "line": HEADER_LINES + block * BLOCK_ROWS,
+                "text": format_memory(address, size, pages.get(address, size), ROW_SIZE),
+                "generation": generation
+            })
+        # a screen before and after, so scrolling on is answered from the cache
+        pages.load(end, end - start)
+        pages.load(max(0, 2 * start - end), start - max(0, 2 * start - end))
+    except xmlrpc.client.Fault as e:
+        lldb_console_message(window, "could not read memory: {}".format(e.faultString))
+
+def watch_viewport(window, view):
+    # runs as long as the view is open
+    if view.id() not in memory_views or not view.window():
+        return
+    render_visible(window, view)
+    sublime.set_timeout(lambda: watch_viewport(window, view), SCROLL_INTERVAL)
+
+def show_memory(window, address):
+    view = memory_view(window)
+    if not view:
+        view = window.new_file()
+        view.set_scratch(True)
+        view.set_name('LLDB Memory')
+        view.set_syntax_file('Packages/SublimeAnarchyDebug/lldb_memory.sublime-syntax')
+    if view.id() not in memory_views:
+        memory_views[view.id()] = { "address": address, "size": 0, "layout": None, "stopped": False, "generation": 0, "rendered": set() }
+        watch_viewport(window, view)
+    memory_views[view.id()]['address'] = address
+    window.focus_view(view)
+    if window.id() in status_callbacks:
+        status_callbacks[window.id()].add(update_memory)
+    sublime.set_timeout_async(lambda: update_memory(window, debug_status.get(window.id(), None), top=True), 0)
+
+
+class updateLldbMemory(sublime_plugin.TextCommand):
+
+    @timed('update_lldb_memory')
+    def run(self, edit, **kwargs):
+        if 'line' in kwargs:
+            # rendered rows replace their address lines, unless the view was laid out again meanwhile
+            state = memory_views.get(self.view.id(), None)
+            if not state or state['generation'] != kwargs['generation']:
+                return
+            text = kwargs['text'].rstrip('\n')
+            first = self.view.text_point(kwargs['line'], 0)
+            last = self.view.line(self.view.text_point(kwargs['line'] + text.count('\n'), 0)).end()
+            self.view.replace(edit, sublime.Region(first, last), text)
+            return
+        if 'status' in kwargs:
+            # the line below the buttons
+            if self.view.rowcol(self.view.size())[0] < HEADER_LINES:
+                self.view.replace(edit, sublime.Region(0, self.view.size()), BUTTONS + "\n" + kwargs['status'] + "\n")
+            else:
+                self.view.replace(edit, self.view.line(self.view.text_point(HEADER_LINES - 1, 0)), kwargs['status'])
+        else:
+            self.view.replace(edit, sublime.Region(0, self.view.size()), kwargs.get("text", ""))
+            self.view.sel().clear()
+        if kwargs.get("top", False):
+            self.view.show(0)
+
+    def is_visible(self):
+        return False
+
+class atdebugMemory(sublime_plugin.WindowCommand):
+
+    def _go_to(self, text):
+        def resolve():
+            try:
+                return resolve_address(self.window, text.strip())
+            except (ValueError, xmlrpc.client.Fault) as e:
+                lldb_console_message(self.window, "no address for {}: {}".format(text.strip(), e))
+                return None
+        command_executor(self.window).submit(
+            resolve, done=lambda address: show_memory(self.window, address) if address is not None else None
+        )
+
+    def run(self, *args, **kwargs):
+        if kwargs.get('address', None) is not None:
+            self._go_to(str(kwargs['address']))
+            return
+        self.window.show_input_panel("Memory at address or expression:", selected_expression(self.window), self._go_to, None, None)
+
+    def is_enabled(self, *args, **kwargs):
+        return debuggers.get(self.window.id(), None) is not None
+
+class LldbMemoryWatcher(sublime_plugin.EventListener):
+
+    def enable(self, view):
+        if not view: return False
+        if "lldb.memory" not in view.scope_name(0): return False
+        return True
+
+    def on_close(self, view):
+        memory_views.pop(view.id(), None)
+
+    def on_activated(self, view):
+        if self.enable(view) and view.window() and view.id() in memory_views:
+            render_visible(view.window(), view)
+
+    def on_selection_modified_async(self, view):
+        if not self.enable(view):
+            return
+
+        window = view.window()
+        if not window or window.id() not in debuggers or view.id() not in memory_views:
+            return
+
+        if len(view.sel()) == 0:
+            return
+
+        scope = view.scope_name(view.sel()[0].begin())
+        state = memory_views[view.id()]
+        size = state['size'] or sublime.load_settings('SublimeAnarchyDebug.sublime-settings').get('memory_view_size', 4096)
+
+        if 'btn_previous' in scope:
+            state['address'] = max(0, state['address'] - size)
+        elif 'btn_next' in scope:
+            state['address'] += size
+        elif 'btn_go_to' in scope:
+            window.run_command('atdebug_memory')
+            return
+        else:
+            return
+        view.sel().clear()
+        update_memory(window, debug_status.get(window.id(), None), top=True)
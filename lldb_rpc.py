@@ -0,0 +1,380 @@
+import base64
+import json
+import socket
+import socketserver
+import xmlrpc.client
+from http.client import CannotSendRequest, ResponseNotReady
+from queue import Empty, Queue
+from time import sleep, perf_counter
+
+try:
+    from .perf import Timings
+except (ImportError, SystemError):
+    # imported as a top level module by the benchmarks
+    from perf import Timings
+
+
+class CountingTransport(xmlrpc.client.Transport):
+    """Remembers the body sizes of the last request and response"""
+
+    sent = 0
+    received = 0
+
+    def send_content(self, connection, request_body):
+        self.sent = len(request_body)
+        xmlrpc.client.Transport.send_content(self, connection, request_body)
+
+    def parse_response(self, response):
+        self.received = int(response.getheader('Content-Length', 0) or 0)
+        return xmlrpc.client.Transport.parse_response(self, response)
+
+
+class XMLRPCConnection(object):
+    """XML-RPC over HTTP, `http://host:port` addresses
+
+    Sessions multiplexed over one bridge are addressed by path,
+    `http://host:port/session/<id>`.
+
+    With a `compress_threshold` requests of that many bytes and more are
+    sent gzip compressed, responses are compressed by the server anyway if
+    they are large enough.
+    """
+
+    def __init__(self, url, compress_threshold=None):
+        self.transport = CountingTransport()
+        self.transport.encode_threshold = compress_threshold
+        self.proxy = xmlrpc.client.ServerProxy(url, transport=self.transport, allow_none=True)
+
+    def call(self, name, args):
+        return getattr(self.proxy, name)(*args)
+
+    def sizes(self):
+        """Bytes of the last request (before compression) and response"""
+        return self.transport.sent, self.transport.received
+
+    def close(self):
+        self.proxy('close')()
+
+
+class JSONLinesConnection(object):
+    """One JSON document per line over a unix domain socket, `unix:///path` addresses
+
+    Request:  {"id": 1, "method": "get_status", "params": []}
+    Response: {"id": 1, "result": "stopped,signal"}
+              {"id": 1, "error": {"code": 1, "message": "..."}}
+
+    Integers are sent as they are, so 64 bit addresses need no string
+    conversion. Errors are raised as xmlrpc.client.Fault and binary results
+    are returned as xmlrpc.client.Binary (sent base64 encoded with
+    `"encoding": "base64"`) to keep callers independent of the transport.
+
+    Sessions multiplexed over one bridge are addressed by fragment,
+    `unix:///path#<id>`, and every request carries `"session": "<id>"`.
+    """
+
+    def __init__(self, url):
+        self.path, _, session = url[len('unix://'):].partition('#')
+        self.session = session or None
+        self.sock = None
+        self.reader = None
+        self.next_id = 0
+        self.sent = 0
+        self.received = 0
+
+    def _connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(self.path)
+        except FileNotFoundError:
+            self.sock = None
+            raise ConnectionRefusedError(self.path)
+        except OSError:
+            self.sock = None
+            raise
+        self.reader = self.sock.makefile('rb')
+
+    def call(self, name, args):
+        if not self.sock:
+            self._connect()
+        self.next_id += 1
+        request = { "id": self.next_id, "method": name, "params": list(args) }
+        if self.session is not None:
+            request['session'] = self.session
+        request = json.dumps(request).encode('utf-8') + b'\n'
+        self.sent = len(request)
+        self.received = 0
+        try:
+            self.sock.sendall(request)
+            line = self.reader.readline()
+        except OSError:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise ConnectionResetError(self.path)
+
+        self.received = len(line)
+        response = json.loads(line.decode('utf-8'))
+        if response.get('error', None) is not None:
+            raise xmlrpc.client.Fault(response['error']['code'], response['error']['message'])
+        if response.get('encoding', None) == 'base64':
+            return xmlrpc.client.Binary(base64.b64decode(response['result']))
+        return response.get('result', None)
+
+    def sizes(self):
+        return self.sent, self.received
+
+    def close(self):
+        if self.sock:
+            self.reader.close()
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+
+def connection_for_url(url, compress_threshold=None):
+    if url.startswith('unix://'):
+        # local only, nothing to gain from compression
+        return JSONLinesConnection(url)
+    return XMLRPCConnection(url, compress_threshold=compress_threshold)
+
+def session_url(url, session_id):
+    """Address of a session the bridge at `url` returned from add_session"""
+    if url.startswith('unix://'):
+        return '{}#{}'.format(url, session_id)
+    return '{}/session/{}'.format(url, session_id)
+
+
+class LLDBProxy(object):
+    """Thread safe proxy for the debug bridge
+
+    Keeps a small pool of keep-alive connections to the debug bridge. Every
+    call borrows one connection exclusively, so the debugger thread, the
+    window commands and the async listeners never interleave requests on
+    the same connection. Calls that still fail with
+    CannotSendRequest/ResponseNotReady are retried a bounded number of
+    times with exponential backoff.
+
+    The transport is picked by the url scheme, `http://` is XML-RPC,
+    `unix://` JSON lines over a unix domain socket.
+
+    Methods the bridge reported as not supported, or calls with a number of
+    arguments the bridge method does not take, fail locally with the same
+    Fault from then on, so optional calls with a fallback cost one round
+    trip per session instead of one per use.
+
+    Independent calls can be sent in one round trip with batch(), which
+    matters for bridges behind a slow link.
+    """
+
+    def __init__(self, url, pool_size=2, retries=3, backoff=0.05, compress_threshold=None):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.compress_threshold = compress_threshold
+        self._pool = Queue()
+        for i in range(max(1, pool_size)):
+            self._pool.put(self._connect())
+        self._unsupported = set()
+        self.timings = Timings()
+
+    def _connect(self):
+        return connection_for_url(self.url, compress_threshold=self.compress_threshold)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args):
+            return self._call(name, args)
+        return call
+
+    def _call(self, name, args):
+        if name in self._unsupported:
+            raise xmlrpc.client.Fault(1, 'method "{}" is not supported'.format(name))
+        if (name, len(args)) in self._unsupported:
+            raise xmlrpc.client.Fault(1, 'TypeError: method "{}" does not take {} arguments'.format(name, len(args)))
+
+        start = perf_counter()
+        retries = 0
+        failed = False
+        sizes = (0, 0)
+        try:
+            while True:
+                connection = self._pool.get()
+                try:
+                    result = connection.call(name, args)
+                    sizes = connection.sizes()
+                    return result
+                except xmlrpc.client.Fault as e:
+                    self._note_fault(name, args, e)
+                    raise
+                except (CannotSendRequest, ResponseNotReady):
+                    # the connection is in an undefined state, replace it
+                    try:
+                        connection.close()
+                    except OSError:
+                        pass
+                    connection = self._connect()
+                    if retries >= self.retries:
+                        raise
+                finally:
+                    self._pool.put(connection)
+                sleep(self.backoff * (2 ** retries))
+                retries += 1
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.timings.record(name, perf_counter() - start, sent=sizes[0], received=sizes[1], retries=retries, failed=failed)
+
+    def _note_fault(self, name, args, fault):
+        if 'is not supported' in fault.faultString:
+            self._unsupported.add(name)
+        elif 'TypeError' in fault.faultString and name + '()' in fault.faultString and 'argument' in fault.faultString:
+            # older bridge version without the optional arguments
+            self._unsupported.add((name, len(args)))
+
+    def batch(self, calls, errors=False):
+        """Makes a list of (name, args) calls in one round trip and returns their results
+
+        Uses system.multicall, bridges without it get the calls one by one.
+        Raises the Fault of the first call that failed, with `errors` the
+        Fault is returned in place of the result instead.
+        """
+        if not calls:
+            return []
+        try:
+            results = self._call('system.multicall', ([{ "methodName": name, "params": list(args) } for name, args in calls],))
+        except xmlrpc.client.Fault:
+            if 'system.multicall' not in self._unsupported:
+                raise
+            results = []
+            for name, args in calls:
+                try:
+                    results.append([self._call(name, args)])
+                except xmlrpc.client.Fault as e:
+                    if not errors:
+                        raise
+                    results.append({ "faultCode": e.faultCode, "faultString": e.faultString })
+
+        values = []
+        for (name, args), result in zip(calls, results):
+            if isinstance(result, dict):
+                fault = xmlrpc.client.Fault(result['faultCode'], result['faultString'])
+                self._note_fault(name, args, fault)
+                if not errors:
+                    raise fault
+                values.append(fault)
+            else:
+                values.append(result[0])
+        return values
+
+    def supports(self, name):
+        """False once the bridge reported the method as not supported"""
+        return name not in self._unsupported
+
+    def latency_stats(self):
+        """Per method counters, payload bytes and latencies in seconds, see Timings.summary"""
+        return self.timings.summary()
+
+    def close(self):
+        """Closes the idle connections of the pool
+
+        They stay in the pool and connect again if the proxy is used after
+        all, a connection that is borrowed right now is left alone.
+        """
+        connections = []
+        while True:
+            try:
+                connections.append(self._pool.get_nowait())
+            except Empty:
+                break
+        for connection in connections:
+            try:
+                connection.close()
+            except OSError:
+                pass
+            self._pool.put(connection)
+
+
+class JSONLinesHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.dispatch_request(json.loads(line.decode('utf-8')))
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class JSONLinesServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Server side of JSONLinesConnection, for bridges and test stand-ins
+
+    Has the same registration interface as SimpleXMLRPCServer, instances
+    of multiplexed sessions are registered with register_session.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        socketserver.UnixStreamServer.__init__(self, path, JSONLinesHandler)
+        self.funcs = {}
+        self.sessions = {} # key = session id, value dict of its funcs
+        self.multicall = False
+
+    def dispatch_request(self, request):
+        response = { "id": request.get('id', None) }
+        funcs = self.funcs
+        if request.get('session', None) is not None:
+            funcs = self.sessions.get(request['session'], {})
+        try:
+            result = self._dispatch(funcs, request['method'], request.get('params', []))
+            if isinstance(result, (bytes, xmlrpc.client.Binary)):
+                result = base64.b64encode(result if isinstance(result, bytes) else result.data).decode('ascii')
+                response['encoding'] = 'base64'
+            response['result'] = result
+        except xmlrpc.client.Fault as e:
+            response['error'] = { "code": e.faultCode, "message": e.faultString }
+        except Exception as e:
+            response['error'] = { "code": 1, "message": "{}:{}".format(type(e).__name__, e) }
+        return response
+
+    def _dispatch(self, funcs, method, params):
+        if method == 'system.multicall' and self.multicall:
+            # same result format as SimpleXMLRPCServer
+            results = []
+            for call in params[0]:
+                try:
+                    results.append([self._dispatch(funcs, call['methodName'], call['params'])])
+                except xmlrpc.client.Fault as e:
+                    results.append({ "faultCode": e.faultCode, "faultString": e.faultString })
+                except Exception as e:
+                    results.append({ "faultCode": 1, "faultString": "{}:{}".format(type(e).__name__, e) })
+            return results
+        func = funcs.get(method, None)
+        if func is None:
+            raise xmlrpc.client.Fault(1, 'method "{}" is not supported'.format(method))
+        return func(*params)
+
+    def register_function(self, function, name=None):
+        self.funcs[name or function.__name__] = function
+
+    def register_instance(self, instance):
+        self.funcs.update(_public_methods(instance))
+
+    def register_multicall_functions(self):
+        self.multicall = True
+
+    def register_session(self, session_id, instance):
+        self.sessions[str(session_id)] = _public_methods(instance)
+
+    def unregister_session(self, session_id):
+        self.sessions.pop(str(session_id), None)
+
+
+def _public_methods(instance):
+    funcs = {}
+    for name in dir(instance):
+        if not name.startswith('_') and callable(getattr(instance, name)):
+            funcs[name] = getattr(instance, name)
+    return funcs
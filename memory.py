@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict
+
+HEX = ["{:02x}".format(i) for i in range(256)]
+PRINTABLE = bytes(c if 32 <= c < 127 else ord('.') for c in range(256))
+
+
+class MemoryPages(object):
+    """Page cache of target memory
+
+    `read(address, size)` fetches memory from the bridge and returns bytes,
+    or None if it is not readable. Consecutive missing pages are fetched
+    with one read and kept as memoryviews into the bytes of that read, so
+    splitting a bulk read into pages copies nothing. Beyond `max_pages` the
+    least recently used pages are dropped.
+    """
+
+    def __init__(self, read, page_size=4096, max_pages=1024):
+        self.read = read
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = OrderedDict() # key = page address, value memoryview of the page, None if not readable
+        self.lock = threading.Lock()
+        self.reads = 0
+
+    def _page_range(self, address, size):
+        first = address - address % self.page_size
+        return range(first, address + max(size, 1), self.page_size)
+
+    def _missing_runs(self, address, size):
+        # consecutive pages that are not cached, as (address, number of pages)
+        runs = []
+        with self.lock:
+            for page in self._page_range(address, size):
+                if page in self.pages:
+                    self.pages.move_to_end(page)
+                elif runs and runs[-1][0] + runs[-1][1] * self.page_size == page:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([page, 1])
+        return runs
+
+    def _fetch(self, page, count):
+        self.reads += 1
+        data = self.read(page, count * self.page_size)
+        if data is None and count > 1:
+            # partly readable, find out page by page
+            for i in range(count):
+                self._fetch(page + i * self.page_size, 1)
+            return
+        view = memoryview(data) if data is not None else None
+        with self.lock:
+            for i in range(count):
+                self.pages[page + i * self.page_size] = view[i * self.page_size:(i + 1) * self.page_size] if view is not None else None
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+
+    def load(self, address, size):
+        """Makes sure the pages of the range are cached, one read per run of missing pages"""
+        for page, count in self._missing_runs(address, size):
+            self._fetch(page, count)
+
+    def get(self, address, size):
+        """Returns the range as a list of (address, memoryview or None if not readable) segments"""
+        self.load(address, size)
+        segments = []
+        end = address + size
+        with self.lock:
+            for page in self._page_range(address, size):
+                data = self.pages.get(page, None)
+                start = max(address, page)
+                stop = min(end, page + self.page_size)
+                if data is not None:
+                    data = data[start - page:stop - page]
+                    if len(data) < stop - start:
+                        # short read at the end of a mapping
+                        segments.append((start, data))
+                        start += len(data)
+                        data = None
+                segments.append((start, data))
+        return [(start, data) for start, data in segments if data is None or len(data) > 0]
+
+    def clear(self):
+        with self.lock:
+            self.pages = OrderedDict()
+
+
+def format_memory(address, size, segments, row_size=16):
+    """Text of `size` bytes from `address` as rows of address, hex and ASCII
+
+    `segments` is what MemoryPages.get returns, bytes that are not readable
+    are shown as `??`.
+    """
+    data = bytearray(size)
+    readable = bytearray(size)
+    for start, segment in segments:
+        offset = start - address
+        if segment is None:
+            continue
+        length = min(len(segment), size - offset)
+        data[offset:offset + length] = segment[:length]
+        readable[offset:offset + length] = b'\x01' * length
+
+    half = row_size // 2
+    lines = []
+    for offset in range(0, size, row_size):
+        row = data[offset:offset + row_size]
+        mask = readable[offset:offset + row_size]
+        if all(mask):
+            hex_bytes = [HEX[b] for b in row]
+            text = row.translate(PRINTABLE).decode('ascii')
+        else:
+            hex_bytes = [HEX[b] if known else "??" for b, known in zip(row, mask)]
+            text = "".join(chr(PRINTABLE[b]) if known else " " for b, known in zip(row, mask))
+        hex_text = " ".join(hex_bytes[:half]) + "  " + " ".join(hex_bytes[half:])
+        lines.append("0x{:016x}  {: <{width}}  {}".format(address + offset, hex_text, text, width=row_size * 3).rstrip() + "\n")
+    return "".join(lines)
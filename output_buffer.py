@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+
+
+class OutputBuffer(object):
+    """Ring buffer between the program output and the console view
+
+    Keeps at most `limit` characters. If the console does not keep up, the
+    oldest output is dropped and counted, so a chatty program can not make
+    the plugin buffer (and later insert) unbounded amounts of text.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+        self.dropped = 0
+        self.total_dropped = 0
+        self.scheduled = False
+        self.lock = threading.Lock()
+
+    def append(self, data):
+        """Add output, returns True if the caller has to schedule a drain"""
+        with self.lock:
+            self.chunks.append(data)
+            self.size += len(data)
+            while self.size > self.limit:
+                chunk = self.chunks.popleft()
+                cut = min(len(chunk), self.size - self.limit)
+                if cut < len(chunk):
+                    self.chunks.appendleft(chunk[cut:])
+                self.size -= cut
+                self.dropped += cut
+                self.total_dropped += cut
+            if self.scheduled:
+                return False
+            self.scheduled = True
+            return True
+
+    def take(self):
+        """Everything buffered and the number of characters dropped since the last take"""
+        with self.lock:
+            data = "".join(self.chunks)
+            dropped = self.dropped
+            self.chunks.clear()
+            self.size = 0
+            self.dropped = 0
+            self.scheduled = False
+            return data, dropped
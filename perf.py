@@ -0,0 +1,135 @@
+import math
+import threading
+from functools import wraps
+from time import perf_counter
+
+
+class Histogram(object):
+    """Latencies in logarithmic buckets, constant memory and time per sample
+
+    A percentile is the upper bound of the bucket it falls into, so it is at
+    most `growth` times the real value.
+    """
+
+    growth = 1.25
+    smallest = 1e-5 # seconds, everything faster lands in the first bucket
+
+    def __init__(self):
+        self.buckets = {} # key = bucket index, value number of samples
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = 0
+        if value > self.smallest:
+            index = int(math.ceil(math.log(value / self.smallest, self.growth)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.smallest * self.growth ** index, self.max)
+        return self.max
+
+
+class Timings(object):
+    """Thread safe latency histograms and payload sizes of named operations"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def _entry(self, name):
+        entry = self.entries.get(name, None)
+        if not entry:
+            entry = { "histogram": Histogram(), "errors": 0, "retries": 0, "sent": 0, "received": 0 }
+            self.entries[name] = entry
+        return entry
+
+    def record(self, name, duration, sent=0, received=0, retries=0, failed=False):
+        with self.lock:
+            entry = self._entry(name)
+            entry['histogram'].add(duration)
+            entry['sent'] += sent
+            entry['received'] += received
+            entry['retries'] += retries
+            if failed:
+                entry['errors'] += 1
+
+    def merge(self, other):
+        with other.lock:
+            entries = [(name, dict(entry)) for name, entry in other.entries.items()]
+        with self.lock:
+            for name, other_entry in entries:
+                entry = self._entry(name)
+                entry['histogram'].merge(other_entry['histogram'])
+                for key in ("errors", "retries", "sent", "received"):
+                    entry[key] += other_entry[key]
+
+    def summary(self):
+        """Per name `calls`, `errors`, `retries`, `sent` and `received` bytes,
+        `total`, `max`, `p50` and `p99` latency in seconds"""
+        with self.lock:
+            summary = {}
+            for name, entry in self.entries.items():
+                histogram = entry['histogram']
+                summary[name] = {
+                    "calls": histogram.count,
+                    "errors": entry['errors'],
+                    "retries": entry['retries'],
+                    "sent": entry['sent'],
+                    "received": entry['received'],
+                    "total": histogram.total,
+                    "max": histogram.max,
+                    "p50": histogram.percentile(50),
+                    "p99": histogram.percentile(99)
+                }
+            return summary
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+
+ui_timings = Timings() # UI callbacks and view edits of all windows
+
+def timed(name, timings=ui_timings):
+    """Decorator that records the duration of every call"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.record(name, perf_counter() - start)
+        return wrapper
+    return decorate
+
+def format_summary(title, summary):
+    """Text table of a Timings summary, slowest total first"""
+    lines = ["{: <28} {: >7} {: >6} {: >9} {: >9} {: >9} {: >10} {: >10} {: >10}".format(
+        title, "calls", "errors", "p50 ms", "p99 ms", "max ms", "total ms", "sent kB", "recv kB")]
+    for name, stat in sorted(summary.items(), key=lambda item: -item[1]['total']):
+        lines.append("{: <28} {: >7} {: >6} {: >9.2f} {: >9.2f} {: >9.2f} {: >10.1f} {: >10.1f} {: >10.1f}".format(
+            name, stat['calls'], stat['errors'],
+            stat['p50'] * 1000, stat['p99'] * 1000, stat['max'] * 1000, stat['total'] * 1000,
+            stat['sent'] / 1024.0, stat['received'] / 1024.0))
+    return "\n".join(lines)
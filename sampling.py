@@ -0,0 +1,57 @@
+class Profile(object):
+    """Result of a sampling run as folded stacks
+
+    A folded stack is the function names of one sampled stack, outermost
+    first, joined by `;`. The bridge aggregates the samples into a count
+    per folded stack, which is also the collapsed stack format flame graph
+    tools read.
+    """
+
+    def __init__(self, stacks, samples=None, duration=0.0, rate=0):
+        self.stacks = stacks # key = folded stack, value number of samples
+        self.samples = sum(stacks.values()) if samples is None else samples
+        self.duration = duration
+        self.rate = rate
+
+    @classmethod
+    def from_bridge(cls, result):
+        return cls(result['stacks'], result.get('samples', None), result.get('duration', 0.0), result.get('rate', 0))
+
+    def functions(self):
+        """(function, inclusive, exclusive) samples, most inclusive first
+
+        A function counts once per sample for inclusive samples however
+        often it recurses, exclusive samples are the ones it was the
+        innermost frame of.
+        """
+        inclusive = {}
+        exclusive = {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            for function in set(frames):
+                inclusive[function] = inclusive.get(function, 0) + count
+            exclusive[frames[-1]] = exclusive.get(frames[-1], 0) + count
+        return sorted(
+            ((function, count, exclusive.get(function, 0)) for function, count in inclusive.items()),
+            key=lambda entry: (-entry[1], -entry[2], entry[0])
+        )
+
+    def collapsed(self):
+        """Text in collapsed stack format, one `stack count` line per folded stack"""
+        return "".join("{} {}\n".format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+    def format(self, limit=500):
+        """Text of the profile view, functions ranked by inclusive samples"""
+        stacked = sum(self.stacks.values()) or 1
+        lines = [
+            "{} samples in {:.1f}s at {} Hz, {} distinct stacks".format(self.samples, self.duration, self.rate, len(self.stacks)),
+            "",
+            "{: >9} {: >7} {: >9} {: >7}  {}".format("inclusive", "%", "exclusive", "%", "function"),
+        ]
+        functions = self.functions()
+        for function, count, own in functions[:limit]:
+            lines.append("{: >9} {: >6.1f}% {: >9} {: >6.1f}%  {}".format(
+                count, 100.0 * count / stacked, own, 100.0 * own / stacked, function))
+        if len(functions) > limit:
+            lines.append("[ {} more functions ]".format(len(functions) - limit))
+        return "\n".join(lines) + "\n"
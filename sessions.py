@@ -0,0 +1,97 @@
+import threading
+
+
+class Bridge(object):
+    """A debug bridge process and the sessions multiplexed over it
+
+    The first session of a bridge debugs the bridge's own target, further
+    sessions get a target of their own on the same bridge if it supports
+    `add_session`. All sessions of a bridge share one event loop.
+
+    `remote` is the url of a bridge that was not launched by the plugin,
+    it has no process and is never shut down.
+    """
+
+    def __init__(self, process, url, lldb, events, remote=None):
+        self.process = process
+        self.url = url
+        self.remote = remote
+        self.lldb = lldb
+        self.events = events
+        self.sessions = {} # key = session id on the bridge (None for the bridge's own target), value Session
+        self.multiplexed = None # unknown until the first add_session
+        self.closing = False
+        self.looping = False
+
+
+class Session(object):
+    """One debug target of a window"""
+
+    def __init__(self, window, name, bridge, key, lldb):
+        self.window = window
+        self.name = name
+        self.bridge = bridge
+        self.key = key
+        self.lldb = lldb
+        self.status = "unknown"
+        self.attached = False
+        self.stopping = False
+        self.sampling = False
+
+
+class SessionManager(object):
+    """Debug sessions of all windows and which one of each window is active
+
+    Everything that shows a single target (stack view, run marker, status
+    bar, LLDB console) follows the active session of the window.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {} # key = window.id, value list of Session in start order
+        self.active_sessions = {} # key = window.id, value Session
+
+    def add(self, session):
+        with self.lock:
+            self.sessions.setdefault(session.window.id(), []).append(session)
+
+    def remove(self, session):
+        """Returns False if the session was removed already"""
+        with self.lock:
+            window_sessions = self.sessions.get(session.window.id(), [])
+            if session not in window_sessions:
+                return False
+            window_sessions.remove(session)
+            if not window_sessions:
+                del self.sessions[session.window.id()]
+            if self.active_sessions.get(session.window.id(), None) is session:
+                del self.active_sessions[session.window.id()]
+            return True
+
+    def for_window(self, window_id):
+        with self.lock:
+            return list(self.sessions.get(window_id, []))
+
+    def active(self, window_id):
+        return self.active_sessions.get(window_id, None)
+
+    def activate(self, session):
+        self.active_sessions[session.window.id()] = session
+
+    def find(self, window_id, name):
+        for session in self.for_window(window_id):
+            if session.name == name:
+                return session
+        return None
+
+    def bridges(self, window_id=None):
+        with self.lock:
+            if window_id is None:
+                window_sessions = [session for sessions in self.sessions.values() for session in sessions]
+            else:
+                window_sessions = self.sessions.get(window_id, [])
+            bridges = []
+            for session in window_sessions:
+                if session.bridge not in bridges:
+                    bridges.append(session.bridge)
+            return bridges
@@ -0,0 +1,73 @@
+import threading
+
+
+class StopCache(object):
+    """Bridge query results that stay valid while the target is stopped
+
+    Holds the stop snapshot of the current stop and everything fetched on
+    top of it (deeper frames, variable children, ...), keyed by query. All
+    entries belong to the stop id of the snapshot and are dropped when the
+    target is resumed or a new snapshot comes in, so read-only refreshes of
+    the UI while stopped are answered without a round trip.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stops = 0
+        self.lock = threading.Lock()
+
+    @property
+    def stop_id(self):
+        if self.snapshot is None:
+            return None
+        return self.snapshot['stop_id']
+
+    def set_snapshot(self, snapshot):
+        with self.lock:
+            if self.snapshot is None or snapshot['stop_id'] != self.snapshot['stop_id']:
+                self.entries = {}
+            self.snapshot = snapshot
+
+    def next_stop_id(self):
+        # for bridges that do not number their stops
+        with self.lock:
+            self.stops += 1
+            return self.stops
+
+    def get_snapshot(self):
+        with self.lock:
+            if self.snapshot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self.snapshot
+
+    def get(self, key, fetch):
+        with self.lock:
+            stop_id = self.stop_id
+            if stop_id is not None and key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = fetch()
+        with self.lock:
+            # only keep it if the target did not move on in the meantime
+            if stop_id is not None and stop_id == self.stop_id:
+                self.entries[key] = value
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            if self.snapshot is not None:
+                self.invalidations += 1
+            self.snapshot = None
+            self.entries = {}
+
+    def stats(self):
+        with self.lock:
+            return { "stop_id": self.stop_id, "entries": len(self.entries), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations }
@@ -0,0 +1,121 @@
+"""Tests of the modules that do not need Sublime Text
+
+    python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lldb_format import StackFormatter, block_changes, BUTTONS
+from memory import MemoryPages, format_memory
+from sampling import Profile
+
+
+class BlockTests(unittest.TestCase):
+
+    def setUp(self):
+        self.formatter = StackFormatter('/project')
+
+    def test_keys(self):
+        blocks = self.formatter.format_blocks([(2, "two"), (1, "one"), (3, "three")], "locals\n", "watches\n")
+        self.assertEqual([key for key, text in blocks], ["buttons", "watches", "thread 2", "locals", "thread 1", "thread 3"])
+        self.assertEqual(blocks[0][1], BUTTONS)
+        # every thread but the last ends with an empty line
+        self.assertEqual([text for key, text in blocks[2:]], ["two\n", "locals\n", "one\n", "three"])
+
+    def test_keys_without_watches(self):
+        blocks = self.formatter.format_blocks([(1, "one")], "locals\n")
+        self.assertEqual([key for key, text in blocks], ["buttons", "thread 1", "locals"])
+
+    def test_unchanged(self):
+        blocks = [["a", "x\n"], ["b", "yy\n"]]
+        self.assertEqual(block_changes(blocks, [list(block) for block in blocks], 5), [])
+
+    def test_changed_blocks_back_to_front(self):
+        previous = [["a", "x\n"], ["b", "yy\n"], ["c", "zzz"]]
+        blocks = [["a", "xx\n"], ["b", "yy\n"], ["c", "z"]]
+        changes = block_changes(previous, blocks, 8)
+        self.assertEqual(changes, [(5, 8, "z"), (0, 2, "xx\n")])
+
+        # applied in order the offsets stay valid
+        text = "".join(text for key, text in previous)
+        for start, end, replacement in changes:
+            text = text[:start] + replacement + text[end:]
+        self.assertEqual(text, "".join(text for key, text in blocks))
+
+    def test_replace_all(self):
+        previous = [["a", "x\n"], ["b", "y"]]
+        self.assertIsNone(block_changes(None, previous, 0))
+        # a thread came or went
+        self.assertIsNone(block_changes(previous, [["a", "x\n"], ["c", "y"]], 3))
+        # the view was edited
+        self.assertIsNone(block_changes(previous, previous, 4))
+
+
+class MemoryPagesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def read(self, address, size):
+        # readable from 0x2000 on
+        self.calls.append((address, size))
+        if address < 0x2000:
+            return None
+        return bytes((address + i) & 0xff for i in range(size))
+
+    def test_one_read_per_run(self):
+        pages = MemoryPages(self.read, page_size=256)
+        segments = pages.get(0x2010, 0x300)
+        self.assertEqual(self.calls, [(0x2000, 0x400)])
+        self.assertEqual(b"".join(bytes(data) for start, data in segments), bytes((0x2010 + i) & 0xff for i in range(0x300)))
+
+        # cached pages are not read again, the missing ones in one run
+        pages.get(0x2000, 0x600)
+        self.assertEqual(self.calls, [(0x2000, 0x400), (0x2400, 0x200)])
+
+    def test_unreadable_pages(self):
+        pages = MemoryPages(self.read, page_size=256)
+        segments = pages.get(0x1f80, 0x100)
+        # the run failed as a whole, then page by page
+        self.assertEqual(self.calls, [(0x1f00, 0x200), (0x1f00, 0x100), (0x2000, 0x100)])
+        self.assertEqual([(start, data is None) for start, data in segments], [(0x1f80, True), (0x2000, False)])
+
+        text = format_memory(0x1ff8, 16, pages.get(0x1ff8, 16))
+        self.assertEqual(text, "0x0000000000001ff8  ?? ?? ?? ?? ?? ?? ?? ??  00 01 02 03 04 05 06 07          ........\n")
+
+    def test_short_read(self):
+        pages = MemoryPages(lambda address, size: b"ab", page_size=16)
+        self.assertEqual([(start, None if data is None else bytes(data)) for start, data in pages.get(0, 4)], [(0, b"ab"), (2, None)])
+
+    def test_least_recently_used_pages_are_dropped(self):
+        pages = MemoryPages(self.read, page_size=256, max_pages=2)
+        pages.load(0x2000, 256)
+        pages.load(0x2100, 256)
+        pages.load(0x2000, 256)
+        pages.load(0x2200, 256)
+        self.assertEqual(sorted(pages.pages), [0x2000, 0x2200])
+
+
+class ProfileTests(unittest.TestCase):
+
+    def test_functions(self):
+        profile = Profile({ "main;run;work": 6, "main;run": 2, "main;work;work": 2 }, duration=1.0, rate=10)
+        self.assertEqual(profile.samples, 10)
+        # recursion counts once for inclusive samples, ties go to more exclusive samples
+        self.assertEqual(profile.functions(), [("main", 10, 0), ("work", 8, 8), ("run", 8, 2)])
+
+    def test_collapsed(self):
+        profile = Profile({ "main;b": 1, "main;a": 3 })
+        self.assertEqual(profile.collapsed(), "main;a 3\nmain;b 1\n")
+
+    def test_from_bridge(self):
+        profile = Profile.from_bridge({ "stacks": { "main": 4 }, "samples": 5, "duration": 0.5, "rate": 10 })
+        self.assertEqual((profile.samples, profile.duration, profile.rate), (5, 0.5, 10))
+        self.assertTrue(profile.format().startswith("5 samples in 0.5s at 10 Hz, 1 distinct stacks\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()